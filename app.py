@@ -26,12 +26,23 @@ import os
 import re
 import json
 import random
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
 import uuid
+import numpy as np
 import pandas as pd
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import pg_adapter as db
 
+try:  # optional: orjson parses the FormSchema/Modules JSON cells several times faster
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
 # --- Safe submit button: works inside or outside a `st.form` ---
 def safe_submit_button(label="Submit", key=None, **kwargs):
     """Render a submit button that works both inside and outside st.form."""
@@ -58,28 +69,46 @@ from pg_adapter import (
 )
 
 import gspread
+from gspread.utils import fill_gaps, rowcol_to_a1
 from google.oauth2.service_account import Credentials
-import requests
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-from email import encoders
 import streamlit_authenticator as stauth
 from contextlib import contextmanager
 import time
 
-# Simple retry helper used by Sheets code
-def retry(fn, tries: int = 3, delay: float = 0.3):
-    last = None
+# Precompiled patterns (used on every rerun / per field)
+_SHEET_ID_RE = re.compile(r"/spreadsheets/d/([A-Za-z0-9-_]+)")
+_MS_TOKEN_RE = re.compile(r"^MS:([^!]+)(?:!(.+))?$")
+_PHONE_STRIP_RE = re.compile(r"[^0-9+]")
+
+_RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+def _is_transient(e: Exception) -> bool:
+    """True for rate limits / server errors / dropped connections; anything else is final."""
+    if isinstance(e, gspread.exceptions.APIError):
+        return getattr(getattr(e, "response", None), "status_code", None) in _RETRY_STATUS
+    if isinstance(e, (ConnectionError, TimeoutError)):
+        return True
+    # requests / urllib3 / google-auth transport errors, matched by name to avoid extra imports
+    return any(c.__name__ in ("ConnectionError", "Timeout", "ReadTimeout", "ConnectTimeout",
+                              "ProtocolError", "TransportError")
+               for c in type(e).__mro__)
+
+# Simple retry helper used by Sheets code: decorrelated-jitter backoff, capped
+# per sleep and bounded by a monotonic deadline so a down API surfaces quickly.
+# Only transient failures are retried (see _is_transient); WorksheetNotFound,
+# 4xx errors and bugs propagate on the first attempt.
+def retry(fn, tries: int = 5, delay: float = 0.3, cap: float = 4.0, deadline_s: float = 20.0):
+    start = time.monotonic()
+    sleep = delay
     for i in range(tries):
         try:
             return fn()
         except Exception as e:
-            last = e
-            if i == tries - 1:
+            left = deadline_s - (time.monotonic() - start)
+            if i == tries - 1 or left <= 0 or not _is_transient(e):
                 raise
-            time.sleep(delay)
+            sleep = min(cap, random.uniform(delay, sleep * 3))
+            time.sleep(min(sleep, left))
 
 # =========================
 # ADMIN UTILITIES (Cloud)
@@ -111,7 +140,7 @@ def run_cloud_migration_ui():
         ]
         gc = gspread.authorize(Credentials.from_service_account_info(creds_info, scopes=scopes))
 
-        m = re.search(r"/spreadsheets/d/([A-Za-z0-9-_]+)", gs.get("sheet_url", ""))
+        m = _SHEET_ID_RE.search(gs.get("sheet_url", ""))
         spreadsheet_id = m.group(1) if m else gs.get("spreadsheet_id")
         if not spreadsheet_id:
             raise RuntimeError("No sheet_url or spreadsheet_id provided in [gsheets].")
@@ -242,6 +271,20 @@ def parse_date(s: pd.Series | str):
     """Parse sheet date strings that are dd/mm/YYYY (or messy) safely."""
     return pd.to_datetime(s, dayfirst=True, errors="coerce")
 
+def day_range_mask(dts: pd.Series, d1: date, d2: date) -> np.ndarray:
+    """Inclusive d1..d2 test on a parsed datetime column as one datetime64[D] compare (NaT never matches)."""
+    day = dts.to_numpy(dtype="datetime64[D]")
+    return (day >= np.datetime64(d1, "D")) & (day <= np.datetime64(d2, "D"))
+
+def serial_to_date_str(s: pd.Series) -> pd.Series:
+    """Sheets serial day numbers (UNFORMATTED_VALUE reads) -> DATE_FMT strings; other cells kept as text."""
+    num = pd.to_numeric(s, errors="coerce")
+    out = s.astype(str)
+    hit = num.notna()
+    if hit.any():
+        out = out.where(~hit, pd.to_datetime(num[hit], origin="1899-12-30", unit="D").dt.strftime(DATE_FMT))
+    return out
+
 # --- Flash helpers ---
 def flash(message: str, level: str = "success"):
     """Persist a one-run flash message and trigger a rerun."""
@@ -288,17 +331,17 @@ CP_COLS = [
 ]
 
 # --- Unified Look (theme + wrappers) ---
-def apply_intake_theme(page_title: str = "RCM Intake", page_icon: str = "🧾"):
-    st.caption(f"Backend: {'Postgres/Neon' if USE_POSTGRES else 'Google Sheets'}")
-    # DO NOT call st.set_page_config here
-    st.markdown("""
-    <style>
+# Static app CSS, built once at import. It is re-sent every run on purpose:
+# Streamlit drops any element a rerun does not emit, so it cannot be gated.
+_INTAKE_CSS = re.sub(r"\s*\n\s*", "", re.sub(r"/\*.*?\*/", "", """
       :root{
         --bg:#ffffff; --panel:#ffffff; --text:#111833; --muted:#445;
         --brand:#4f8cff; --brand2:#22d3ee; --radius:12px; --shadow:0 4px 14px rgba(0,0,0,.08);
       }
-      .stApp { background:#ffffff !important; }
-      header, .viewerBadge_link__1S137 { display:none!important; }
+      header { display:flex !important; }
+      .viewerBadge_link__1S137 { display:none !important; }
+      .stAppDeployButton, [data-testid="stActionMenu"] { display:none !important; }
+      /* DO NOT hide [data-testid="stToolbar"] or the whole header */
       .block-container { padding-top:2rem; padding-bottom:2.5rem; max-width:1200px; }
       label{ color:#334; font-weight:600!important }
       .intake-topbar{ background:#f5f7ff; padding:10px 14px; border-radius:10px; border:1px solid #e7ebff; }
@@ -315,8 +358,12 @@ def apply_intake_theme(page_title: str = "RCM Intake", page_icon: str = "🧾"):
       .sec{display:flex;align-items:center;gap:.6rem;margin:6px 0 14px}
       .sec .dot{width:10px;height:10px;border-radius:999px;background:linear-gradient(90deg,#4f8cff,#22d3ee)}
       .sec h3{margin:0;color:#111833;font-size:1.05rem;letter-spacing:.2px}
-    </style>
-    """, unsafe_allow_html=True)
+""", flags=re.S))
+
+def apply_intake_theme(page_title: str = "RCM Intake", page_icon: str = "🧾"):
+    st.caption(f"Backend: {'Postgres/Neon' if USE_POSTGRES else 'Google Sheets'}")
+    # DO NOT call st.set_page_config here
+    st.markdown(f"<style>{_INTAKE_CSS}</style>", unsafe_allow_html=True)
 
 @contextmanager
 def intake_page(title: str, subtitle: str | None = None, badge: str | None = None):
@@ -346,20 +393,6 @@ apply_intake_theme("RCM Intake")
 # Branding & global toolbar hide (incl. login)
 # ─────────────────────────────────────────────────────────────────────────────
 LOGO_PATH = "assets/logo.png"
-st.markdown("""
-<style>
-/* Keep header visible so the sidebar toggle is available */
-header { display:flex !important; }
-
-/* It’s fine to hide the “viewer badge” */
-.viewerBadge_link__1S137 { display:none !important; }
-
-/* If you still want a clean look, you can hide deploy/action buttons only */
-.stAppDeployButton, [data-testid="stActionMenu"] { display:none !important; }
-/* DO NOT hide [data-testid="stToolbar"] or the whole header */
-
-</style>
-""", unsafe_allow_html=True)
 
 try:
     col_logo, col_title = st.columns([1, 8], vertical_alignment="center")
@@ -411,7 +444,7 @@ if not USE_POSTGRES:
     def _extract_spreadsheet_id(gs: dict) -> str:
         url = (gs.get("sheet_url") or "").strip()
         if url:
-            m = re.search(r"/spreadsheets/d/([a-zA-Z0-9-_]+)", url)
+            m = _SHEET_ID_RE.search(url)
             if m: return m.group(1)
         return (gs.get("spreadsheets_id") or gs.get("spreadsheet_id") or "").strip()
 
@@ -445,51 +478,183 @@ if not USE_POSTGRES:
     gc = get_gspread_client()
     sh = get_spreadsheet(gc)
 
-    def ws(name: str):
-        try: return retry(lambda: sh.worksheet(name))
-        except gspread.WorksheetNotFound: return retry(lambda: sh.add_worksheet(name, rows=2000, cols=120))
+    @st.cache_resource(show_spinner=False)
+    def _title_to_ws() -> dict:
+        """One sh.worksheets() call per process; ws()/list_titles() read from this map."""
+        return {w.title: w for w in retry(lambda: sh.worksheets())}
+
+    def ws(name: str, rows: int = 2000, cols: int = 120):
+        cached = _title_to_ws()
+        w = cached.get(name)
+        if w is None:
+            # Miss: another process may have added it, else create it
+            try: w = retry(lambda: sh.worksheet(name))
+            except gspread.WorksheetNotFound: w = retry(lambda: sh.add_worksheet(name, rows=rows, cols=cols))
+            cached[name] = w
+        return w
 
-    @st.cache_data(ttl=60)
     def list_titles():
-        return {w.title for w in retry(lambda: sh.worksheets())}
+        return set(_title_to_ws().keys())
 else:
     # Postgres mode: no Sheets; provide safe stubs to avoid accidental calls
-    def ws(name: str):
+    def ws(name: str, rows: int = 2000, cols: int = 120):
         raise RuntimeError("ws() is not available in Postgres mode")
-    @st.cache_data(ttl=60)
     def list_titles():
         return set()
 
+def _read_sheet_columns(title: str, columns: tuple, unformatted: bool = False) -> pd.DataFrame:
+    """Only the named columns of a sheet (absent ones are skipped): header row + one column batchGet."""
+    head = [str(h).strip() for h in retry(lambda: ws(title).row_values(1))]
+    pos = {c: head.index(c) for c in dict.fromkeys(columns) if c in head}
+    if not pos:
+        return pd.DataFrame()
+    letters = [rowcol_to_a1(1, j + 1)[:-1] for j in pos.values()]
+    render = "UNFORMATTED_VALUE" if unformatted else "FORMATTED_VALUE"
+    res = retry(lambda: ws(title).batch_get([f"{L}2:{L}" for L in letters],
+                                            major_dimension="COLUMNS", value_render_option=render))
+    cols = [vr[0] if vr else [] for vr in res]
+    n = max(map(len, cols), default=0)
+    # Trailing blanks are trimmed per column; pad each to the sheet's row count
+    data = {c: (v + [""] * (n - len(v))) for c, v in zip(pos, cols)}
+    df = pd.DataFrame(data)
+    return df.infer_objects() if unformatted else df
+
 # Robust reader: ALWAYS returns a DataFrame with the requested headers (even when sheet is empty/missing)
-def read_sheet_df(title: str, required_headers: list[str] | None = None) -> pd.DataFrame:
+# unformatted=True returns typed cells (ints/floats, dates as serial day numbers) instead of display strings.
+# columns=(...) projects to just those columns (Sheets: only they cross the wire; no header repair).
+def read_sheet_df(title: str, required_headers: list[str] | None = None, unformatted: bool = False,
+                  columns: tuple | None = None) -> pd.DataFrame:
     if USE_POSTGRES:
-        return pg_read_sheet_df(title, required_headers)
-    vals = retry(lambda: ws(title).get_all_values())
+        return pg_read_sheet_df(title, required_headers, columns=columns)
+    if columns:
+        return _read_sheet_columns(title, columns, unformatted)
+    if unformatted:
+        vals = retry(lambda: ws(title).get("A1:ZZ", value_render_option="UNFORMATTED_VALUE"))
+    else:
+        vals = st.session_state.get("_sheet_raw", {}).pop(title, None)  # consumed once (see prefetch_sheets)
+        if vals is None:
+            vals = retry(lambda: ws(title).get_all_values())
     if not vals:
         if required_headers:
             retry(lambda: ws(title).update("A1", [required_headers]))
             return pd.DataFrame(columns=required_headers)
         return pd.DataFrame()
-    header = [h.strip() for h in vals[0]] if vals[0] else []
+    header = [str(h).strip() for h in vals[0]] if vals[0] else []
     rows = vals[1:] if len(vals) > 1 else []
     if required_headers:
         header = list(dict.fromkeys(header + [h for h in required_headers if h not in header]))
-    rows = [r + [""]*(len(header)-len(r)) for r in rows]
-    df = pd.DataFrame(rows, columns=header)
-    return df.fillna("")
+    w = len(header)
+    if any(len(r) != w for r in rows):
+        # Ragged grid: pad into one preallocated object block instead of a new list per row
+        arr = np.full((len(rows), w), "", dtype=object)
+        for i, r in enumerate(rows):
+            arr[i, :len(r)] = r
+        df = pd.DataFrame(arr, columns=header)
+        if unformatted:
+            df = df.infer_objects()  # keep numeric columns typed, as the list constructor did
+    else:
+        df = pd.DataFrame(rows, columns=header)
+    return df  # Sheets cells are never NaN (padding is ""), so no fillna pass
+
+# Module sheet cache: writes and Refresh bump the sheet's version; the 5-minute TTL is the
+# backstop for edits this process cannot see (other workers, the Sheets UI)
+@st.cache_resource(show_spinner=False)
+def _module_versions() -> dict:
+    """Process-wide write counter per module sheet (part of the load_module_df cache key)."""
+    return {}
+
+def bump_module_version(sheet_name: str):
+    v = _module_versions()
+    v[sheet_name] = v.get(sheet_name, 0) + 1
+    _drop_disk_cache(sheet_name)  # Drive's modifiedTime lags the write; never serve the pre-save copy
 
-# Wrapper: unified loader for module data sheets (robust, cached)
-@st.cache_data(ttl=300)
 def load_module_df(sheet_name: str) -> pd.DataFrame:
+    return _load_module_df(sheet_name, _module_versions().get(sheet_name, 0))
+
+# On-disk Parquet copies of module sheets (Sheets mode), one folder per spreadsheet revision
+SHEET_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".sheet_cache")
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _spreadsheet_revision() -> str:
+    """Drive modifiedTime of the spreadsheet (Sheets exposes no revisionId); "" if unavailable."""
+    if USE_POSTGRES:
+        return ""
+    try:
+        getter = getattr(sh, "get_lastUpdateTime", None)  # gspread 6; 5.x: lastUpdateTime property
+        return str(retry(getter) if getter else retry(lambda: sh.lastUpdateTime) or "")
+    except Exception:
+        return ""
+
+def _disk_cache_path(sheet_name: str) -> str | None:
+    rev = _spreadsheet_revision()
+    if not rev:
+        return None
+    digest = lambda v: hashlib.blake2b(v.encode(), digest_size=12).hexdigest()
+    return os.path.join(SHEET_CACHE_DIR, digest(rev), digest(sheet_name) + ".parquet")
+
+def _drop_disk_cache(sheet_name: str):
+    """Delete every on-disk copy of a sheet (all revision folders) and re-read the revision next time."""
+    _spreadsheet_revision.clear()
+    name = hashlib.blake2b(sheet_name.encode(), digest_size=12).hexdigest() + ".parquet"
+    if not os.path.isdir(SHEET_CACHE_DIR):
+        return
+    for rev in os.listdir(SHEET_CACHE_DIR):
+        try: os.remove(os.path.join(SHEET_CACHE_DIR, rev, name))
+        except OSError: pass
+
+@st.cache_resource(show_spinner=False)
+def _disk_served() -> set:
+    """Sheets already served from their Parquet copy in this process."""
+    return set()
+
+def _write_disk_cache(path: str, df: pd.DataFrame):
     try:
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            # New revision: older revision folders can never be hit again
+            if os.path.isdir(SHEET_CACHE_DIR):
+                for old in os.listdir(SHEET_CACHE_DIR):
+                    shutil.rmtree(os.path.join(SHEET_CACHE_DIR, old), ignore_errors=True)
+            os.makedirs(folder, exist_ok=True)
+        df.to_parquet(path, compression="zstd")
+    except Exception:
+        pass  # cache is best-effort (read-only FS, duplicate headers, ...)
+
+def _stamp_load(df: pd.DataFrame) -> pd.DataFrame:
+    """Tag a fresh sheet load; df.attrs survives the cache's pickling and row slicing."""
+    df.attrs["_load_token"] = uuid.uuid4().hex
+    return df
+
+def _load_token(df: pd.DataFrame | None) -> str:
+    """Token of the load `df` came from: changes on every re-read (write, Refresh, TTL, eviction)."""
+    return "" if df is None else str(df.attrs.get("_load_token", ""))
+
+# Wrapper: unified loader for module data sheets (robust, cached)
+@st.cache_data(ttl=300, max_entries=64, show_spinner=False)
+def _load_module_df(sheet_name: str, version: int) -> pd.DataFrame:
+    try:
+        # A process restart re-reads an unchanged spreadsheet from local Parquet, not the Sheets API.
+        # Only the first cold (version 0) load in this process may use it: after a write, Refresh
+        # or TTL expiry the sheet is re-read live.
+        path = _disk_cache_path(sheet_name)
+        served = _disk_served()
+        if path and version == 0 and sheet_name not in served and os.path.exists(path):
+            served.add(sheet_name)
+            try: return _stamp_load(pd.read_parquet(path).astype("string[pyarrow]"))  # parquet keeps "string", not its storage
+            except Exception: pass
         rows = retry(lambda: ws(sheet_name).get_all_values()) or []
         if not rows:
-            return pd.DataFrame()
+            return _stamp_load(pd.DataFrame())
         header = [h.strip() for h in rows[0]] if rows else []
         data = rows[1:] if len(rows) > 1 else []
         df = pd.DataFrame(data, columns=header) if header else pd.DataFrame()
         df.columns = [c.strip() for c in df.columns]
-        return df.fillna("")
+        # Every cell is text: Arrow-backed strings are far smaller than object columns and
+        # str.contains / isin / == run in Arrow compute (pyarrow ships with Streamlit)
+        df = df.astype("string[pyarrow]")
+        if path:
+            _write_disk_cache(path, df)
+        return _stamp_load(df)
     except Exception as e:
         st.warning(f"Could not load data for '{sheet_name}': {e}")
         return pd.DataFrame()
@@ -501,27 +666,93 @@ def _is_admin_like(role: str) -> bool:
     r = (role or "").strip().lower()
     return r in ("admin", "super admin", "superadmin")
 
-def _apply_common_filters(df: pd.DataFrame, scope_to_user: bool = False) -> pd.DataFrame:
-    if df is None or df.empty:
-        return df
-    out = df.copy()
+def _as_text(s: pd.Series) -> pd.Series:
+    """Text view of a column; Arrow-backed string columns are used as-is (astype(str) would re-box them)."""
+    return s if isinstance(s.dtype, pd.StringDtype) else s.astype(str)
+
+def _scope_mask(df: pd.DataFrame, scope_to_user: bool) -> np.ndarray:
+    # One combined mask over the scope columns; the caller slices once
+    mask = np.ones(len(df), dtype=bool)
 
     # Client scope
-    if "ClientID" in out.columns:
+    if "ClientID" in df.columns:
         if str(CLIENT_ID).strip().upper() not in ("", "ALL"):
-            out = out[out["ClientID"].astype(str).str.upper() == str(CLIENT_ID).strip().upper()]
+            mask &= (_as_text(df["ClientID"]).str.upper() == str(CLIENT_ID).strip().upper()).to_numpy()
 
     # Pharmacy ACL scope
-    if ALLOWED_PHARM_IDS and ALLOWED_PHARM_IDS != ["ALL"] and "PharmacyID" in out.columns:
-        out = out[out["PharmacyID"].astype(str).isin([str(x) for x in ALLOWED_PHARM_IDS])]
+    if _PHARM_RESTRICTED and "PharmacyID" in df.columns:
+        mask &= _as_text(df["PharmacyID"]).isin(_ALLOWED_SET).to_numpy()
 
     # User scope (only on pages where we ask for it)
     if scope_to_user and not _is_admin_like(ROLE):
-        if "SubmittedBy" in out.columns:
+        if "SubmittedBy" in df.columns:
             mine = {s for s in [(username or "").strip().lower(), (name or "").strip().lower()] if s}
-            out = out[out["SubmittedBy"].astype(str).str.lower().isin(mine)]
+            mask &= _as_text(df["SubmittedBy"]).str.lower().isin(mine).to_numpy()
+
+    return mask
+
+def _scope_key(scope_to_user: bool) -> tuple:
+    """Everything _apply_common_filters reads from globals, as a hashable cache key."""
+    who = ((username or "").strip().lower(), (name or "").strip().lower()) if scope_to_user else ("", "")
+    return (str(CLIENT_ID), tuple(sorted(_ALLOWED_SET)) if _PHARM_RESTRICTED else ("ALL",), ROLE, who, scope_to_user)
 
-    return out.fillna("")
+@st.cache_resource(max_entries=64)
+def _cached_scope_mask(_df: pd.DataFrame, sheet_name: str, token: str, scope: tuple) -> np.ndarray:
+    # keyed on the load token, never the version: a re-read with the same version can hold other rows
+    return _scope_mask(_df, scope_to_user=scope[-1])
+
+def _apply_common_filters(df: pd.DataFrame, scope_to_user: bool = False, sheet_name: str | None = None) -> pd.DataFrame:
+    """Client / pharmacy-ACL / (optionally) own-rows scope. Pass `sheet_name` when `df` is that
+    sheet's load_module_df(): the upper/lower-cased key columns are then normalized once per
+    sheet load + scope and the per-rerun cost is a single gather."""
+    if df is None or df.empty:
+        return df
+    mask = None
+    token = _load_token(df) if sheet_name is not None else ""
+    if token:
+        mask = _cached_scope_mask(df, sheet_name, token, _scope_key(scope_to_user))
+        if len(mask) != len(df):
+            mask = None
+    if mask is None:
+        mask = _scope_mask(df, scope_to_user)
+    return df[mask].fillna("")
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _scoped_column_options(sheet_name: str, token: str, scope: tuple, col: str) -> list:
+    df = _apply_common_filters(load_module_df(sheet_name), scope_to_user=scope[-1], sheet_name=sheet_name)
+    if df is None or df.empty or col not in df.columns:
+        return []
+    return sorted(v for v in pd.unique(_as_text(df[col])) if v)
+
+def column_options(df: pd.DataFrame, sheet_name: str, col: str, scope_to_user: bool) -> list:
+    """Sorted distinct non-empty values of `col` in the user's scoped sheet; cached per sheet load
+    (`df` is the caller's slice of load_module_df(), whose load token keys the cache)."""
+    return _scoped_column_options(sheet_name, _load_token(df), _scope_key(scope_to_user), col)
+
+def _join_lowered(frame: pd.DataFrame, cols: tuple) -> pd.Series:
+    want = set(cols)
+    # positional, so repeated header names (e.g. several blank ones) each contribute their own column
+    parts = [_as_text(frame.iloc[:, j]).fillna("") for j, c in enumerate(frame.columns) if c in want]
+    if not parts:
+        return pd.Series("", index=frame.index, dtype="string[pyarrow]")
+    hay = parts[0].str.cat(parts[1:], sep="\x1f") if len(parts) > 1 else parts[0]
+    return hay.str.lower()
+
+@st.cache_resource(max_entries=16)
+def _lowered_search_text(sheet_name: str, token: str, cols: tuple) -> pd.Series | None:
+    raw = load_module_df(sheet_name)
+    # None when the sheet was re-read since the caller's frame was loaded; the caller builds its own
+    return _join_lowered(raw, cols) if _load_token(raw) == token else None
+
+def lowered_search_text(df: pd.DataFrame, sheet_name: str, cols: tuple) -> pd.Series:
+    """Lower-cased, "\x1f"-joined text of `cols` for the rows of `df` (a slice of the sheet's
+    load_module_df()); built once per sheet load so per-keystroke filters only run a literal
+    Arrow substring scan."""
+    token = _load_token(df)
+    hay = _lowered_search_text(sheet_name, token, cols) if token else None
+    if hay is None or not df.index.isin(hay.index).all():
+        return _join_lowered(df, cols)
+    return hay.loc[df.index]
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Masters & Config sheets
@@ -543,6 +774,9 @@ MS_MODULES = "Modules"              # catalog of modules
 MS_CLIENT_MODULES = "ClientModules" # per-client enable map
 MS_FORM_SCHEMA = "FormSchema"       # per-client+module field schema
 
+# Bootstrap marker tab (Meta!A1 holds BOOTSTRAP_MARK, defined below the schema it hashes)
+META_TAB = "Meta"
+
 DEFAULT_TABS = [
     DATA_TAB, USERS_TAB, MS_PHARM, MS_INSURANCE, MS_DOCTORS, MS_USER_MODULES,
     MS_SUBMISSION_MODE, MS_PORTAL, MS_STATUS,
@@ -585,53 +819,84 @@ SEED_MODULES = [
     ["Lab","Data_Lab","FALSE","","[]"],
 ]
 
+# Hash of the tab layout + seeds: any change to them re-runs the bootstrap, no manual bump needed
+BOOTSTRAP_MARK = "bootstrap_" + hashlib.blake2b(
+    json.dumps([DEFAULT_TABS, REQUIRED_HEADERS, SEED_SIMPLE, SEED_MODULES], sort_keys=True).encode(),
+    digest_size=8,
+).hexdigest()
+
 def ensure_tabs_and_headers():
     existing = list_titles()
-    for t in DEFAULT_TABS:
-        if t not in existing: retry(lambda: sh.add_worksheet(t, rows=2000, cols=120))
-    for tab, headers in REQUIRED_HEADERS.items():
-        df = read_sheet_df(tab, headers)  # ensures header row exists
-        if df.columns.tolist() != headers:
-            merged = list(dict.fromkeys(df.columns.tolist() + [h for h in headers if h not in df.columns]))
-            retry(lambda: ws(tab).update("A1", [merged]))
-    # seed simple lists
-    for tab, values in SEED_SIMPLE.items():
-        df = read_sheet_df(tab, ["Value"])
-        if df.empty or df.shape[0] == 0:
-            retry(lambda: ws(tab).update("A1", [["Value"], *[[v] for v in values]]))
-    # seed modules
-    mdf = read_sheet_df(MS_MODULES, REQUIRED_HEADERS[MS_MODULES])
-    if mdf.shape[0] == 0:
-        retry(lambda: ws(MS_MODULES).update("A1", [REQUIRED_HEADERS[MS_MODULES]]))
-        retry(lambda: ws(MS_MODULES).update("A2", SEED_MODULES))
+    for t in dict.fromkeys([*DEFAULT_TABS, *REQUIRED_HEADERS]):
+        if t not in existing: ws(t)  # creates the tab and records it in the ws map
+    # One batchGet of rows 1-2 for every tab: row 1 is the header, an empty row 2 means "needs seeding"
+    tabs = list(REQUIRED_HEADERS)
+    res = retry(lambda: sh.values_batch_get([f"'{t}'!1:2" for t in tabs]))
+    data = []
+    for tab, vr in zip(tabs, res.get("valueRanges", [])):
+        rows = vr.get("values") or []
+        head = [str(h).strip() for h in (rows[0] if rows else [])]
+        empty = len(rows) < 2 or not any(str(v).strip() for v in rows[1])
+        # seed simple lists / modules (these writes include the header row)
+        if empty and tab in SEED_SIMPLE:
+            data.append({"range": f"'{tab}'!A1", "values": [["Value"], *[[v] for v in SEED_SIMPLE[tab]]]})
+            continue
+        if empty and tab == MS_MODULES:
+            data.append({"range": f"'{tab}'!A1", "values": [REQUIRED_HEADERS[MS_MODULES], *SEED_MODULES]})
+            continue
+        missing = [h for h in REQUIRED_HEADERS[tab] if h not in head]
+        if missing:
+            # Only write the absent header cells (after the existing ones); order/extra columns are fine
+            data.append({"range": f"'{tab}'!{rowcol_to_a1(1, len(head) + 1)}", "values": [missing]})
+    if data:
+        retry(lambda: sh.values_batch_update({"valueInputOption": "RAW", "data": data}))
 
 @st.cache_resource(show_spinner=False)
 def _init_sheets_once():
+    # One cell read: a spreadsheet already bootstrapped at this version skips the header sweep
+    if retry(lambda: ws(META_TAB, rows=10, cols=2).acell("A1").value) == BOOTSTRAP_MARK:
+        return True
     ensure_tabs_and_headers()
     _ensure_module_sheets_exist()
+    retry(lambda: ws(META_TAB).update("A1", [[BOOTSTRAP_MARK]]))
     return True
 
 def _ensure_module_sheets_exist():
+    if USE_POSTGRES:
+        return  # pg_append_row creates a module's table on its first write
     df = read_sheet_df(MS_MODULES, REQUIRED_HEADERS[MS_MODULES])
-    for _, r in df.iterrows():
-        module = str(r.get("Module","")).strip()
+    sheets = []
+    for module, sheet in zip(df["Module"].astype(str).str.strip(), df["SheetName"].astype(str).str.strip()):
         if not module: continue
-        sheet = (r.get("SheetName") or "").strip() or f"Data_{module}"
-        if sheet not in list_titles():
-            retry(lambda: sh.add_worksheet(sheet, rows=5000, cols=160))
-        wsx = ws(sheet)
-        head = retry(lambda: wsx.row_values(1))
-        if not head:
-            meta = ["Timestamp","SubmittedBy","Role","ClientID","PharmacyID","PharmacyName","Module","RecordID"]
-            retry(lambda: wsx.update("A1", [meta]))
-
-if not USE_POSTGRES:
+        sheets.append(sheet or f"Data_{module}")
+    sheets = list(dict.fromkeys(sheets))
+    if not sheets:
+        return
+    # One addSheet batchUpdate for every missing tab (fresh title map: a stale one would re-add a tab)
+    _title_to_ws.clear()
+    missing = [t for t in sheets if t not in list_titles()]
+    if missing:
+        reqs = [{"addSheet": {"properties": {"title": t, "gridProperties": {"rowCount": 5000, "columnCount": 160}}}} for t in missing]
+        retry(lambda: sh.batch_update({"requests": reqs}))
+        _title_to_ws.clear()
+    # One batchGet of every header row, one values batchUpdate for the blank ones
+    res = retry(lambda: sh.values_batch_get([f"'{t}'!1:1" for t in sheets]))
+    blank = [t for t, vr in zip(sheets, res.get("valueRanges", [])) if not vr.get("values")]
+    if blank:
+        meta = ["Timestamp","SubmittedBy","Role","ClientID","PharmacyID","PharmacyName","Module","RecordID"]
+        data = [{"range": f"'{t}'!A1", "values": [meta]} for t in blank]
+        retry(lambda: sh.values_batch_update({"valueInputOption": "RAW", "data": data}))
+
+if not USE_POSTGRES and not st.session_state.get("_schema_ensured"):
     _init_sheets_once()
+    st.session_state["_schema_ensured"] = True
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Cached reads / masters
+# Master frames are cache_resource (shared by reference, no per-hit unpickle): callers
+# only filter/select from them; anything that mutates must take a .copy() first.
 # ─────────────────────────────────────────────────────────────────────────────
-@st.cache_data(ttl=60, show_spinner=False)
+@st.cache_resource(ttl=60, show_spinner=False)
 def pharm_master() -> pd.DataFrame:
     df = read_sheet_df(MS_PHARM, REQUIRED_HEADERS[MS_PHARM]).fillna("")
     if df.empty: return pd.DataFrame(columns=["ID","Name","Display"])
@@ -640,10 +905,39 @@ def pharm_master() -> pd.DataFrame:
     df["Display"] = df["ID"] + " - " + df["Name"]
     return df
 
+@st.cache_data(ttl=60, show_spinner=False)
+def pharm_name_by_id() -> dict:
+    """{ID: Name}; pharmacy selectboxes store the ID and render it through _pharm_label."""
+    df = pharm_master()
+    return dict(zip(df["ID"], df["Name"])) if not df.empty else {}
+
+def _pharm_label(pid) -> str:
+    name = pharm_name_by_id().get(pid)
+    return f"{pid} - {name}" if name is not None else str(pid)
+
 def pharm_display_list() -> list[str]:
     df = pharm_master()
     return df["Display"].tolist() if not df.empty else ["—"]
 
+@st.cache_resource(ttl=60, show_spinner=False)
+def _allowed_pharm_rows(allowed: tuple) -> tuple:
+    """(IDs, Displays) of the pharmacies in `allowed` (empty tuple = no ACL), in master order."""
+    df = pharm_master()
+    if allowed:
+        df = df[df["ID"].isin(allowed)]
+    return tuple(df["ID"]), tuple(df["Display"])
+
+def _pharm_acl_key() -> tuple:
+    return tuple(sorted(_ALLOWED_SET)) if _PHARM_RESTRICTED else ()
+
+def allowed_pharm_ids() -> list[str]:
+    """Pharmacy IDs this user may pick (["—"] when none); built once per ACL per master load."""
+    return list(_allowed_pharm_rows(_pharm_acl_key())[0]) or ["—"]
+
+def allowed_pharm_choices() -> list[str]:
+    """'ID - Name' labels this user may pick (["—"] when none)."""
+    return list(_allowed_pharm_rows(_pharm_acl_key())[1]) or ["—"]
+
 # ---------- Clinic Purchase: price map + seeders ----------
 @st.cache_data(ttl=120, show_spinner=False)
 def _clinic_items_price_map() -> dict:
@@ -651,13 +945,8 @@ def _clinic_items_price_map() -> dict:
     if df.empty:
         return {}
     df["Value"] = pd.to_numeric(df["Value"], errors="coerce").fillna(0.0)
-    pm = {}
-    for _, r in df.iterrows():
-        name = str(r.get("Particulars","")).strip()
-        price = float(r.get("Value", 0.0))
-        if name:
-            pm[name] = price
-    return pm
+    names = df["Particulars"].astype(str).str.strip()
+    return {n: float(v) for n, v in zip(names, df["Value"]) if n}
 
 def _ensure_ws_with_headers(title, headers):
     """
@@ -756,19 +1045,24 @@ def seed_clinic_purchase_assets_for_client(client_id: str) -> bool:
         newfs = pd.DataFrame(rows, columns=REQUIRED_HEADERS[MS_FORM_SCHEMA])
         out = pd.concat([fs, newfs], ignore_index=True)
         _save_whole_sheet(MS_FORM_SCHEMA, out, REQUIRED_HEADERS[MS_FORM_SCHEMA])
-        schema_df.clear(); modules_catalog_df.clear(); client_modules_df.clear()
+        schema_df.clear(); schema_rows_for.clear(); compiled_schema_for.clear(); modules_catalog_df.clear(); module_dup_keys_index.clear(); client_modules_df.clear()
         changed = True
 
     return changed
 
-@st.cache_data(ttl=60, show_spinner=False)
+@st.cache_resource(ttl=60, show_spinner=False)
 def insurance_master() -> pd.DataFrame:
     df = read_sheet_df(MS_INSURANCE, REQUIRED_HEADERS[MS_INSURANCE]).fillna("")
     if df.empty: return pd.DataFrame(columns=["Code","Name","Display"])
     df["Display"] = (df.get("Code","").astype(str).str.strip()+" - "+df.get("Name","").astype(str).str.strip()).str.strip(" -")
     return df[["Code","Name","Display"]]
 
-@st.cache_data(ttl=60, show_spinner=False)
+@st.cache_resource(ttl=60, show_spinner=False)
+def insurance_choices() -> tuple:
+    """'Code - Name' labels of the insurance master, built once per master load."""
+    return tuple(insurance_master()["Display"])
+
+@st.cache_resource(ttl=60, show_spinner=False)
 def doctors_master(client_id: str | None = None, pharmacy_id: str | None = None) -> pd.DataFrame:
     df = read_sheet_df(MS_DOCTORS, REQUIRED_HEADERS[MS_DOCTORS]).fillna("")
     if df.empty:
@@ -800,9 +1094,32 @@ def _list_from_sheet(title, col_candidates=("Value","Name","Mode","Portal","Stat
     pick = next((c for c in df.columns if df[c].astype(str).str.strip().any()), df.columns[0])
     return [v for v in df[pick].astype(str) if v]
 
+# Single-column enum sheets (header "Value"): all three fetched together by masters_batch()
+_ONE_COL_SHEETS = (MS_SUBMISSION_MODE, MS_PORTAL, MS_STATUS)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def masters_batch() -> dict:
+    """{title: [values]} for the enum sheets; one values.batchGet on Sheets (column A only)."""
+    if USE_POSTGRES:
+        return {t: list(_list_from_sheet(t)) for t in _ONE_COL_SHEETS}
+    raw = st.session_state.get("_sheet_raw", {})
+    if all(t in raw for t in _ONE_COL_SHEETS):  # already fetched by prefetch_sheets
+        grids = [raw.pop(t) for t in _ONE_COL_SHEETS]
+    else:
+        res = retry(lambda: sh.values_batch_get([f"'{t}'!A:A" for t in _ONE_COL_SHEETS]))
+        grids = [vr.get("values", []) for vr in res.get("valueRanges", [])]
+    out = {}
+    for t, rows in zip(_ONE_COL_SHEETS, grids):
+        col = [r[0] if r else "" for r in rows[1:]]
+        out[t] = [v for v in col if v]
+    return out
+
 def safe_list(title, fallback):
     try:
-        lst = _list_from_sheet(title)
+        if title in _ONE_COL_SHEETS:
+            lst = masters_batch().get(title, [])
+        else:
+            lst = _list_from_sheet(title)
         return lst if lst else list(fallback)
     except Exception:
         return list(fallback)
@@ -812,7 +1129,7 @@ def safe_list(title, fallback):
 # ─────────────────────────────────────────────────────────────────────────────
 def load_users_df():
     try:
-        df = read_sheet_df(USERS_TAB, REQUIRED_HEADERS[USERS_TAB]).copy()
+        df = read_sheet_df(USERS_TAB, REQUIRED_HEADERS[USERS_TAB])
         for col in REQUIRED_HEADERS[USERS_TAB]:
             if col not in df.columns: df[col] = ""
         if not df.empty: df.columns = df.columns.str.strip().str.lower()
@@ -826,8 +1143,6 @@ def _safe_users_df():
 
 USERS_DF = load_users_df()
 
-import json
-import streamlit_authenticator as stauth
 
 def _hash_password_compat(pwd: str) -> str:
     """Return a bcrypt hash. Works regardless of streamlit-authenticator version."""
@@ -856,8 +1171,6 @@ def _hash_password_compat(pwd: str) -> str:
     return stauth.Hasher([pwd]).generate()[0]
 
 
-import json
-import streamlit_authenticator as stauth
 
 def build_authenticator(cookie_suffix: str = ""):
     auth_sec = st.secrets.get("auth", {})
@@ -949,6 +1262,10 @@ def get_user_role_pharms_client(u):
     return "User", ["ALL"], "DEFAULT"
 
 role_from_sheet, ALLOWED_PHARM_IDS, CLIENT_ID = get_user_role_pharms_client(username)
+# Built once per run: O(1) membership for every pharmacy ACL check below
+_ALLOWED_SET = frozenset(str(x).strip() for x in ALLOWED_PHARM_IDS)
+# False for "ALL" (or no list): every ACL check below short-circuits on this flag
+_PHARM_RESTRICTED = bool(_ALLOWED_SET) and _ALLOWED_SET != {"ALL"}
 ROLE = "Super Admin" if st.session_state.get("_role") == "Super Admin" else role_from_sheet
 
 def _show_toolbar_for_superadmin(role: str):
@@ -982,7 +1299,21 @@ with st.expander("Debug / Advanced"):
 # ─────────────────────────────────────────────────────────────────────────────
 # Dynamic modules engine
 # ─────────────────────────────────────────────────────────────────────────────
-@st.cache_data(ttl=60)
+_TRUTHY_UPPER = frozenset({"TRUE", "1", "YES"})
+
+def _json_list(text: str) -> tuple:
+    """'["A","B"]' -> ('A','B'); blank, invalid or non-list JSON -> ()."""
+    try:
+        v = _json_loads(text) if str(text).strip() else []
+    except Exception:
+        return ()
+    return tuple(v) if isinstance(v, list) else ()
+
+def _role_set(spec: str) -> frozenset:
+    """'User|Admin' -> frozenset({'user','admin'})."""
+    return frozenset(x.strip().lower() for x in str(spec or "").split("|") if x.strip())
+
+@st.cache_resource(ttl=60)
 def modules_catalog_df() -> pd.DataFrame:
     df = read_sheet_df(MS_MODULES, REQUIRED_HEADERS[MS_MODULES]).fillna("")
     if not df.empty:
@@ -992,12 +1323,15 @@ def modules_catalog_df() -> pd.DataFrame:
             s = df["DefaultEnabled"].astype(str)
         else:
             s = pd.Series([""] * len(df), index=df.index)
-        df["DefaultEnabled"] = s.str.upper().isin(["TRUE","1","YES"])
+        df["DefaultEnabled"] = s.str.upper().isin(_TRUTHY_UPPER)
         df["DupKeys"] = df.get("DupKeys", "").astype(str)
         df["NumericFieldsJSON"] = df.get("NumericFieldsJSON", "[]").astype(str)
+        # Parsed once per catalog load: the duplicate check / Summary / Update read these directly
+        df["_DupKeys"] = df["DupKeys"].map(lambda s: tuple(k.strip() for k in s.split("|") if k.strip()))
+        df["_NumericFields"] = df["NumericFieldsJSON"].map(_json_list)
     return df
 
-@st.cache_data(ttl=60)
+@st.cache_resource(ttl=60)
 def client_modules_df() -> pd.DataFrame:
     df = read_sheet_df(MS_CLIENT_MODULES, REQUIRED_HEADERS[MS_CLIENT_MODULES]).fillna("")
     if not df.empty:
@@ -1006,7 +1340,7 @@ def client_modules_df() -> pd.DataFrame:
         df["Enabled"]  = _to_bool_series(df["Enabled"])
     return df
 
-@st.cache_data(ttl=60)
+@st.cache_resource(ttl=60)
 def user_modules_df() -> pd.DataFrame:
     df = read_sheet_df(MS_USER_MODULES, REQUIRED_HEADERS[MS_USER_MODULES]).fillna("")
     if not df.empty:
@@ -1015,13 +1349,25 @@ def user_modules_df() -> pd.DataFrame:
         df["Enabled"]  = _to_bool_series(df["Enabled"])
     return df
 
+@st.cache_resource(ttl=60)
+def user_module_index() -> dict:
+    """{username (lower): frozenset of Enabled modules} for every user with UserModules rows."""
+    um = user_modules_df()
+    if um.empty:
+        return {}
+    out = {}
+    for u, m, on in zip(um["Username"].str.lower(), um["Module"], um["Enabled"]):
+        out.setdefault(u, set())
+        if on: out[u].add(m)
+    return {u: frozenset(ms) for u, ms in out.items()}
+
 def modules_enabled_for(client_id: str, role: str) -> list[tuple[str,str]]:
     cat = modules_catalog_df()
     if cat.empty:
         return []
     r = str(role).strip().lower()
     if r in ("super admin","superadmin"):
-        base = cat.copy()
+        base = cat
     else:
         cm = client_modules_df()
         if cm.empty or cm[cm["ClientID"] == client_id].empty:
@@ -1029,38 +1375,90 @@ def modules_enabled_for(client_id: str, role: str) -> list[tuple[str,str]]:
         else:
             allowed_client = set(cm[(cm["ClientID"] == client_id) & (cm["Enabled"])]["Module"].tolist())
             base = cat[cat["Module"].isin(allowed_client)]
-    um = user_modules_df()
-    if not um.empty:
-        mine = um[um["Username"].str.lower() == str(username).lower()]
-        if not mine.empty:
-            allowed_user = set(mine[mine["Enabled"]]["Module"].tolist())
-            base = base[base["Module"].isin(allowed_user)]
-    return [(r["Module"], r["SheetName"] or f"Data_{r['Module']}") for _, r in base.iterrows()]
-
-@st.cache_data(ttl=60)
+    allowed_user = user_module_index().get(str(username).lower())
+    if allowed_user is not None:  # user has UserModules rows: only their Enabled ones
+        base = base[base["Module"].isin(allowed_user)]
+    return list(zip(base["Module"], base["SheetName"].where(base["SheetName"] != "", "Data_" + base["Module"])))
+
+@st.cache_resource(ttl=60)
 def schema_df() -> pd.DataFrame:
-    df = read_sheet_df(MS_FORM_SCHEMA, REQUIRED_HEADERS[MS_FORM_SCHEMA]).fillna("")
-    for col in REQUIRED_HEADERS[MS_FORM_SCHEMA]:
-        if col not in df.columns:
-            df[col] = ""
-    df["ClientID"] = df["ClientID"].astype(str).str.strip().str.upper()
-    df["Module"]         = df["Module"].astype(str).str.strip()
-    df["FieldKey"]       = df["FieldKey"].astype(str).str.strip()
-    df["Label"]          = df["Label"].astype(str)
-    df["Type"]           = df["Type"].astype(str).str.lower().str.strip()
-    df["Required"]       = df["Required"].astype(str).str.upper().isin(["TRUE","1","YES"])
-    df["RoleVisibility"] = df["RoleVisibility"].astype(str)
-    df["Order"]          = pd.to_numeric(df["Order"], errors="coerce").fillna(9999).astype(int)
-    df["SaveTo"]         = df["SaveTo"].astype(str).str.strip()
-    df["Options"]        = df["Options"].astype(str)
-    df["Default"]        = df["Default"].astype(str)
-    df["ReadOnlyRoles"]  = df["ReadOnlyRoles"].astype(str)
+    hdrs = REQUIRED_HEADERS[MS_FORM_SCHEMA]
+    df = read_sheet_df(MS_FORM_SCHEMA, hdrs).fillna("")
+    missing = [c for c in hdrs if c not in df.columns]
+    if missing:
+        df = df.assign(**dict.fromkeys(missing, ""))
+    # One str cast over the schema columns, then a single assign for all coercions
+    txt = df[hdrs].astype(str)
+    df = df.assign(
+        ClientID=txt["ClientID"].str.strip().str.upper(),
+        Module=txt["Module"].str.strip(),
+        FieldKey=txt["FieldKey"].str.strip(),
+        Label=txt["Label"],
+        Type=txt["Type"].str.strip().str.lower(),
+        Required=txt["Required"].str.upper().isin(_TRUTHY_UPPER),
+        RoleVisibility=txt["RoleVisibility"],
+        Order=pd.to_numeric(txt["Order"], errors="coerce").fillna(9999).astype(int),
+        SaveTo=txt["SaveTo"].str.strip(),
+        Options=txt["Options"],
+        Default=txt["Default"],
+        ReadOnlyRoles=txt["ReadOnlyRoles"],
+    )
+    # Pre-parsed role specs so renders do a set lookup instead of split/strip/lower
+    df["_RoleVisibleSet"]   = df["RoleVisibility"].map(_role_set)
+    df["_ReadOnlyRolesSet"] = df["ReadOnlyRoles"].map(_role_set)
     return df
 
-# Only Super Admin sees debug schema preview
-if str(ROLE).strip().lower() in ("super admin", "superadmin"):
+@st.cache_resource(ttl=60, show_spinner=False)
+def schema_rows_for(module_name: str, client_id: str) -> pd.DataFrame:
+    """Order-sorted FormSchema rows for a module (client's own + DEFAULT + ALL); read-only.
+    Cleared together with schema_df."""
+    sdf = schema_df()
+    return (
+        sdf[(sdf["Module"] == module_name) & (sdf["ClientID"].isin([client_id, "DEFAULT", "ALL"]))]
+        .sort_values("Order")
+    )
+
+@st.cache_resource(ttl=60, show_spinner=False)
+def compiled_schema_for(module_name: str, client_id: str, role: str) -> list[dict]:
+    """The role's visible fields of schema_rows_for(), with widget kind, read-only flag and parsed
+    defaults decided once per (module, client, role); read-only. Cleared together with schema_df."""
+    rows = schema_rows_for(module_name, client_id)
+    # Defaults converted once per column instead of per-field try/except
+    dflt     = rows["Default"].astype(str).str.strip()
+    dflt_num = pd.to_numeric(dflt, errors="coerce").fillna(0.0).tolist()
+    is_date  = rows["Type"].astype(str).str.lower().str.strip() == "date"
+    dflt_dt  = pd.to_datetime(dflt.where(is_date, ""), dayfirst=True, errors="coerce", format="mixed").tolist()
+    cols = ["FieldKey","Label","Type","Required","Default","Options","SaveTo","_RoleVisibleSet","_ReadOnlyRolesSet"]
+    fields = []
+    for i, (fkey, label, typ, required, default, options, save_to, vis, ro) in enumerate(rows[cols].itertuples(index=False, name=None)):
+        if not _role_visible(vis, role):
+            continue
+        typ = (typ or "").lower().strip()
+        # Same precedence as the widget chain: int, number/date/select/multiselect, phone, textarea, text
+        if typ in ("integer", "int") or _is_int_field(fkey):
+            kind = "int"
+        elif typ in ("number", "date", "select", "multiselect"):
+            kind = typ
+        elif typ in ("phone", "tel") or _is_phone_field(fkey):
+            kind = "phone"
+        elif typ == "textarea":
+            kind = "textarea"
+        else:
+            kind = "text"
+        fields.append({
+            "i": i, "key": fkey, "label": label, "label_req": label + ("*" if required else ""),
+            "type": typ, "kind": kind, "required": bool(required), "readonly": _is_readonly(ro, role),
+            "default": default, "options": options, "save_to": save_to or fkey,
+            "num": dflt_num[i], "dt": dflt_dt[i],
+            "phone": typ in ("phone", "tel") or _is_phone_field(fkey),  # saved as '+digits even if int-typed
+        })
+    return fields
+
+# Only Super Admin sees debug schema preview; opt-in so the table isn't rebuilt every rerun
+if str(ROLE).strip().lower() in ("super admin", "superadmin") and st.sidebar.checkbox("Show schema debug", key="_dbg_sch"):
     with st.expander("🔍 Debug: FormSchema Preview (first 50 rows)"):
-        st.dataframe(schema_df().head(50), use_container_width=True, hide_index=True)
+        st.dataframe(schema_df().head(50).drop(columns=["_RoleVisibleSet","_ReadOnlyRolesSet"], errors="ignore"),
+                     use_container_width=True, hide_index=True)
 
 # ---- Field typing helpers ----
 INT_KEYS   = {"age", "years"}
@@ -1086,9 +1484,9 @@ def _options_from_token(token: str) -> list[str]:
         if not ph_id:
             mod_key = st.session_state.get("_current_module", st.session_state.get("nav_mod", ""))
             if mod_key:
-                ph_disp = st.session_state.get(f"{mod_key}_pharmacy_display", "")
-                if isinstance(ph_disp, str) and " - " in ph_disp:
-                    ph_id = ph_disp.split(" - ", 1)[0].strip()
+                pid = st.session_state.get(f"{mod_key}_pharmacy_id", "")
+                if pid in pharm_name_by_id():
+                    ph_id = pid
         role_is_super = str(ROLE).strip().lower() in ("super admin","superadmin")
         use_client = None if role_is_super or key == "doctorsall" or str(CLIENT_ID).upper() in ("", "ALL") else CLIENT_ID
         use_pharm  = ph_id if ph_id and ph_id.upper() != "ALL" else None
@@ -1122,7 +1520,7 @@ def _options_from_token(token: str) -> list[str]:
 
     # --- GENERIC: MS:<Sheet>[!<Column>] ---
     if token.startswith("MS:"):
-        m = re.match(r"^MS:([^!]+)(?:!(.+))?$", token)
+        m = _MS_TOKEN_RE.match(token)
         if m:
             sheet = m.group(1).strip()
             col   = (m.group(2) or "").strip()
@@ -1134,42 +1532,44 @@ def _options_from_token(token: str) -> list[str]:
                     df = insurance_master()
                     return df["Display"].tolist() if not df.empty else []
 
-                df = read_sheet_df(sheet, None).fillna("")
-                if df.empty: return []
-                if col and col in df.columns:
-                    ser = df[col].astype(str)
-                else:
-                    pick = next((c for c in df.columns if df[c].astype(str).str.strip().any()), df.columns[0])
-                    ser = df[pick].astype(str)
-                return [v for v in ser.str.strip().unique().tolist() if v]
+                return list(_master_column_options(sheet, col))
             except Exception:
                 return []
 
-    # --- Literal list ---
-    if token.startswith("L:"):
-        return [x.strip() for x in token[2:].split("|") if x.strip()]
+    # --- Literal list / JSON array (pure parse; memoized per token) ---
+    return list(_static_options(token))
 
-    # --- JSON array ---
+@st.cache_data(ttl=60, show_spinner=False)
+def _master_column_options(sheet: str, col: str = "") -> tuple:
+    df = read_sheet_df(sheet, None).fillna("")
+    if df.empty: return ()
+    if col and col in df.columns:
+        ser = df[col].astype(str)
+    else:
+        pick = next((c for c in df.columns if df[c].astype(str).str.strip().any()), df.columns[0])
+        ser = df[pick].astype(str)
+    return tuple(v for v in ser.str.strip().unique().tolist() if v)
+
+def _static_options(token: str) -> tuple:
+    if token.startswith("L:"):
+        return tuple(x.strip() for x in token[2:].split("|") if x.strip())
     try:
-        arr = json.loads(token)
+        arr = _json_loads(token)
         if isinstance(arr, list):
-            return [str(x) for x in arr]
+            return tuple(str(x) for x in arr)
     except Exception:
         pass
+    return ()
 
-    return []
-
-def _role_visible(rolespec: str, role: str) -> bool:
-    rs = (rolespec or "").strip()
-    if not rs or rs.lower() == "all": return True
-    allowed = [x.strip().lower() for x in rs.split("|") if x.strip()]
+def _role_visible(rolespec, role: str) -> bool:
+    """rolespec may be the raw 'A|B' string or a pre-parsed frozenset (see schema_df)."""
+    allowed = rolespec if isinstance(rolespec, frozenset) else _role_set(rolespec)
+    if not allowed or allowed == {"all"}: return True
     return str(role).strip().lower() in allowed
 
-def _is_readonly(readonly_roles: str, role: str) -> bool:
-    spec = (readonly_roles or "").strip()
-    if not spec: return False
-    allowed = [x.strip().lower() for x in spec.split("|") if x.strip()]
-    return str(role).strip().lower() in allowed
+def _is_readonly(readonly_roles, role: str) -> bool:
+    allowed = readonly_roles if isinstance(readonly_roles, frozenset) else _role_set(readonly_roles)
+    return bool(allowed) and str(role).strip().lower() in allowed
 
 def _is_int_field(key: str) -> bool:
     k = (key or "").strip().lower()
@@ -1179,42 +1579,63 @@ def _is_phone_field(key: str) -> bool:
     k = (key or "").strip().lower()
     return any(tag in k for tag in PHONE_KEYS)
 
+@st.cache_resource(ttl=60, show_spinner=False)
+def module_dup_keys_index() -> dict:
+    """{module: parsed DupKeys tuple}; first catalog row wins, as the old row filter did."""
+    cat = modules_catalog_df()
+    if cat.empty:
+        return {}
+    out = {}
+    for m, keys in zip(cat["Module"], cat["_DupKeys"]):
+        out.setdefault(m, keys)
+    return out
+
+def _module_dup_keys(module_name: str) -> tuple:
+    return module_dup_keys_index().get(module_name, ())
+
+def _dup_key(data_map: dict, cols: tuple) -> tuple:
+    return tuple(str(data_map.get(c, "")).strip().lower() for c in cols)
+
+@st.cache_resource(ttl=60, show_spinner=False)
+def _dup_index(sheet_name: str, dup_keys: tuple) -> tuple:
+    """(key columns, set of normalized key tuples) for a module sheet; one sheet read per 60s.
+    cache_resource (not cache_data) so keys added after a save stick to the cached set."""
+    # Only PharmacyID + the key columns are fetched, not the whole module sheet
+    df = read_sheet_df(sheet_name, None, unformatted=True, columns=("PharmacyID",) + tuple(dup_keys))
+    if df.empty or any(c not in df.columns for c in dup_keys):
+        return (), set()
+    cols = tuple(dict.fromkeys((("PharmacyID",) if "PharmacyID" in df.columns else ()) + dup_keys))
+    # Date keys arrive as serial numbers; render them the way format_date() wrote them
+    for k in dup_keys:
+        if k.lower().endswith("date"):
+            df[k] = serial_to_date_str(df[k])
+    # strip/lower as Arrow string kernels; only the final tolist() materializes Python strs for the set
+    norm = [df[c].astype("string[pyarrow]").str.strip().str.lower().tolist() for c in cols]
+    return cols, set(zip(*norm))
+
 def _check_duplicate_if_needed(sheet_name: str, module_name: str, data_map: dict) -> bool:
     if USE_POSTGRES:
         return False  # TODO: implement SQL-based duplicate check later
-    cat = modules_catalog_df()
-    row = cat[cat["Module"]==module_name]
-    if row.empty: return False
-    raw_keys = (row.iloc[0].get("DupKeys") or "").strip()
-    if not raw_keys: return False
-    dup_keys = [k.strip() for k in raw_keys.split("|") if k.strip()]
+    dup_keys = _module_dup_keys(module_name)
     if not dup_keys: return False
     try:
-        wsx = ws(sheet_name)
-        # Narrow fast: if a date-like key is present, filter by that first
-        if any(k.lower().endswith("date") for k in dup_keys):
-            datekey = next(k for k in dup_keys if k.lower().endswith("date"))
-            sd = data_map.get(datekey, "")
-            all_rows = retry(lambda: wsx.get_all_records())
-            df = pd.DataFrame([r for r in all_rows if str(r.get(datekey,"")) == str(sd)])
-        else:
-            df = pd.DataFrame(retry(lambda: wsx.get_all_records()))
-        if df.empty: return False
-
-        for c in dup_keys:
-            if c not in df.columns: return False
-        if "PharmacyID" in df.columns and "PharmacyID" in data_map:
-            df = df[df["PharmacyID"].astype(str).str.strip() == str(data_map["PharmacyID"]).strip()]
-
-        mask = pd.Series([True]*len(df))
-        for k in dup_keys:
-            sv = str(data_map.get(k, "")).strip().lower()
-            mask = mask & (df.get(k, "").astype(str).str.strip().str.lower() == sv)
-
-        return bool(df[mask].shape[0] > 0)
+        cols, seen = _dup_index(sheet_name, dup_keys)
+        return bool(cols) and _dup_key(data_map, cols) in seen
     except Exception:
         return False
 
+def _remember_duplicate_key(sheet_name: str, module_name: str, data_map: dict):
+    """Add a just-saved row to the cached index so a resubmit within the TTL is still caught."""
+    if USE_POSTGRES:
+        return
+    dup_keys = _module_dup_keys(module_name)
+    if not dup_keys: return
+    try:
+        cols, seen = _dup_index(sheet_name, dup_keys)
+        if cols: seen.add(_dup_key(data_map, cols))
+    except Exception:
+        pass
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Auto-seeding helper for FormSchema
 # ─────────────────────────────────────────────────────────────────────────────
@@ -1262,9 +1683,10 @@ def seed_form_schema_for_module(module: str, client_id: str = "DEFAULT"):
     }
     rows = packs.get(module.lower(), base)
     w = ws(MS_FORM_SCHEMA)
-    for r in rows:
-        retry(lambda: w.append_row(r, value_input_option="USER_ENTERED"))
+    retry(lambda: w.append_rows(rows, value_input_option="USER_ENTERED"))
     schema_df.clear()
+    schema_rows_for.clear()
+    compiled_schema_for.clear()
 
 # --- Masters Admin helpers ----------------------------------------------------
 ALLOWED_FIELD_TYPES = {
@@ -1286,19 +1708,19 @@ def _save_whole_sheet(sheet_title: str, df: pd.DataFrame, headers: list[str]):
         if h not in df.columns:
             df[h] = ""
     # Reorder + fill
-    out = df[headers].copy().fillna("")
+    out = df[headers].fillna("")
     # Cast booleans as TRUE/FALSE for nicer Sheets compatibility
     for c in out.columns:
         if out[c].dtype == bool:
             out[c] = out[c].map(lambda x: "TRUE" if bool(x) else "FALSE")
     w = ws(sheet_title)
     try:
-        try:
-            w.clear()
-        except Exception:
-            w.batch_clear(["A:ZZ"])
         arr = [headers] + out.astype(str).values.tolist()
         retry(lambda: w.update("A1", arr, value_input_option="USER_ENTERED"))
+        # Write first, then trim whatever the previous (larger) version left below/right of it,
+        # so deleted rows vanish without the sheet ever being empty mid-save
+        right = f"{rowcol_to_a1(1, len(headers) + 1)}:ZZ{len(arr)}"
+        retry(lambda: w.batch_clear([f"A{len(arr) + 1}:ZZ", right]))
         return True
     except Exception as e:
         st.error(f"Save failed: {e}")
@@ -1317,11 +1739,14 @@ def _get_engine():
     # Neon needs sslmode=require in the URL (you already have it)
     return create_engine(url, pool_pre_ping=True, future=True)
 
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9_]+")
+_MULTI_US_RE  = re.compile(r"_{2,}")
+
 def _sheet_title_to_table(title: str) -> str:
     """Map 'Data_Pharmacy' -> 'data_pharmacy', 'Clients' -> 'clients'."""
     t = (title or "").strip().lower()
-    t = re.sub(r"[^a-z0-9_]+", "_", t)      # non-alnum → _
-    t = re.sub(r"_{2,}", "_", t).strip("_") # collapse __
+    t = _NON_ALNUM_RE.sub("_", t)               # non-alnum → _
+    t = _MULTI_US_RE.sub("_", t).strip("_")     # collapse __
     return t
 
 def _engine():
@@ -1345,10 +1770,13 @@ def _table_exists(table: str) -> bool:
         st.error(f"SQLAlchemy error: {e}")
         raise
 
-def pg_read_sheet_df(title: str, required_headers=None) -> pd.DataFrame:
+def pg_read_sheet_df(title: str, required_headers=None, unformatted: bool = False,
+                     columns: tuple | None = None) -> pd.DataFrame:
     """
     Read a 'sheet' as a table from Postgres.
     Returns empty DF with required_headers if table doesn't exist yet.
+    `unformatted` exists for signature parity with the Sheets reader (values are already typed).
+    `columns`, if given, projects the result to those columns (missing ones are skipped).
     """
     table = _sheet_title_to_table(title)
     eng = _get_engine()
@@ -1366,6 +1794,8 @@ def pg_read_sheet_df(title: str, required_headers=None) -> pd.DataFrame:
 
     with eng.begin() as con:
         df = pd.read_sql(sql, con)
+    if columns:
+        df = df[[c for c in dict.fromkeys(columns) if c in df.columns]]
     return df
 
 def pg_save_whole_sheet(title: str, df: pd.DataFrame, headers: list[str]):
@@ -1414,7 +1844,7 @@ if USE_POSTGRES:
     append_row        = pg_append_row  # (only if you call append_row anywhere)
 
 def _load_for_editor(title: str, headers: list[str]) -> pd.DataFrame:
-    df = read_sheet_df(title, headers).copy()
+    df = read_sheet_df(title, headers)
     # Best-effort cast typical boolean columns
     for col in ("DefaultEnabled","Enabled","Required"):
         if col in df.columns:
@@ -1446,7 +1876,7 @@ def _json_validate_field(text: str) -> tuple[bool, str]:
     if not str(text).strip():
         return True, "[]"
     try:
-        data = json.loads(text)
+        data = _json_loads(text)
         if isinstance(data, list):
             return True, json.dumps(data)
         return False, "Must be a JSON array, e.g. [\"Amount\",\"Qty\"]"
@@ -1472,19 +1902,83 @@ def _validate_schema_block(df: pd.DataFrame) -> list[str]:
 def _clear_all_caches():
     try:
         pharm_master.clear()
+        pharm_name_by_id.clear()
+        _allowed_pharm_rows.clear()
         insurance_master.clear()
+        insurance_choices.clear()
         doctors_master.clear()
         modules_catalog_df.clear()
+        module_dup_keys_index.clear()
         client_modules_df.clear()
         user_modules_df.clear()
+        user_module_index.clear()
         schema_df.clear()
-        load_module_df.clear()
-        list_titles.clear()
+        schema_rows_for.clear()
+        compiled_schema_for.clear()
+        _load_module_df.clear()
         _clinic_items_price_map.clear()
         _clinic_opening_map.clear()
+        _master_column_options.clear()
+        _dup_index.clear()
+        masters_batch.clear()
+        _numeric_probe_columns.clear()
+        _scoped_column_options.clear()
+        _lowered_search_text.clear()
+        _cached_scope_mask.clear()
+        _masters_warm.clear()
     except Exception:
         pass
 
+# Master/config tabs read on every cold session; fetched together by prefetch_sheets()
+_MASTER_SHEETS = (MS_PHARM, MS_INSURANCE, MS_MODULES, MS_CLIENT_MODULES, MS_USER_MODULES, MS_FORM_SCHEMA) + _ONE_COL_SHEETS
+
+def prefetch_sheets(titles) -> None:
+    """One values.batchGet for `titles`; each grid is parked in session_state["_sheet_raw"]
+    for read_sheet_df / masters_batch to consume once. Sheets mode only; on any error the
+    readers simply fall back to their own per-sheet fetch."""
+    if USE_POSTGRES:
+        return
+    titles = list(titles)
+    try:
+        res = retry(lambda: sh.values_batch_get([f"'{t}'!A1:ZZ" for t in titles], params={"majorDimension": "ROWS"}))
+    except Exception:
+        return
+    # fill_gaps: same rectangular grid get_all_values() returns
+    st.session_state["_sheet_raw"] = {t: fill_gaps(vr.get("values", [])) for t, vr in zip(titles, res.get("valueRanges", []))}
+
+@st.cache_resource(ttl=55, show_spinner=False)
+def _masters_warm() -> dict:
+    """Process-wide marker set after a prime; expires just before the 60s master caches."""
+    return {}
+
+def _prime_master_caches():
+    """Warm the master reads once per session: one batchGet for every master tab, then the
+    cached builders run in parallel on the prefetched grids (Postgres: parallel queries).
+    Skipped when another session primed the shared caches within the last 55s."""
+    if st.session_state.get("_masters_primed"):
+        return
+    warm = _masters_warm()
+    if warm.get("primed"):
+        st.session_state["_masters_primed"] = True
+        return
+    prefetch_sheets(_MASTER_SHEETS)
+    ctx = get_script_run_ctx()
+    def _run(fn):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn()
+    jobs = [
+        pharm_master, insurance_master, modules_catalog_df, client_modules_df, user_modules_df,
+        schema_df, masters_batch,
+    ]
+    with ThreadPoolExecutor(max_workers=7) as ex:
+        for f in [ex.submit(_run, fn) for fn in jobs]:
+            try: f.result()
+            except Exception: pass  # the synchronous caller will surface the error
+    # Grids whose cache was already warm were never consumed; drop them so no later read sees them
+    st.session_state.pop("_sheet_raw", None)
+    warm["primed"] = True
+    st.session_state["_masters_primed"] = True
+
 def _sanitize_cell(v):
     s = str(v or "")
     return "'" + s if s and s[0] in "=+-@" else s
@@ -1492,7 +1986,7 @@ def _sanitize_cell(v):
 def _clear_module_form_state(module_name: str, schema_rows: pd.DataFrame):
     """Remove all Streamlit widget state for a module so the form starts blank on rerun."""
     try:
-        keys = [f"{module_name}_pharmacy_display", f"{module_name}_dup_override"]
+        keys = [f"{module_name}_pharmacy_id", f"{module_name}_dup_override"]
         if schema_rows is not None and not schema_rows.empty and "FieldKey" in schema_rows.columns:
             for fk in schema_rows["FieldKey"].astype(str):
                 keys.append(f"{module_name}_{fk}")
@@ -1511,8 +2005,6 @@ def _cached_masters():
         "submission_modes": safe_list(MS_SUBMISSION_MODE, ["Walk-in","Phone","Email","Portal"]),
         "portals":          safe_list(MS_PORTAL, ["DHPO","Riayati","Insurance Portal"]),
         "statuses":         safe_list(MS_STATUS, ["Submitted","Approved","Rejected","Pending","RA Pending"]),
-        "pharm_df":         pharm_master(),
-        "ins_df":           insurance_master(),
     }
 
 # --- Helper: read the selected "Type" from session_state safely
@@ -1529,6 +2021,27 @@ def get_submission_type(module_key: str | None = None) -> str:
             return v
     return ""
 
+# Legacy pharmacy form widget defaults (submission_date is seeded with today's date separately)
+_LEGACY_FORM_DEFAULTS = {
+    "employee_name": "",
+    "submission_mode": "",
+    "type": "Insurance",
+    "pharmacy_display": "",
+    "portal": "",
+    "erx_number": "",
+    "insurance_display": "",
+    "member_id": "",
+    "eid": "",
+    "claim_id": "",
+    "approval_code": "",
+    "net_amount": 0.0,
+    "patient_share": 0.0,
+    "status": "",
+    "remark": "",
+    "allow_dup_override": False,
+    "_was_cash": False,
+}
+
 def _render_legacy_pharmacy_intake(sheet_name: str):
     LEGACY_HEADERS = [
         "Timestamp","SubmittedBy","Role",
@@ -1560,37 +2073,16 @@ def _render_legacy_pharmacy_intake(sheet_name: str):
     submission_modes = list(M["submission_modes"])
     portals          = list(M["portals"])
     statuses         = list(M["statuses"])
-    pharm_df         = M["pharm_df"].copy()
-    ins_df           = M["ins_df"].copy()
-
-    if ALLOWED_PHARM_IDS and ALLOWED_PHARM_IDS != ["ALL"]:
-        pharm_df = pharm_df[pharm_df["ID"].isin(ALLOWED_PHARM_IDS)]
-    pharm_choices = pharm_df["Display"].tolist() if not pharm_df.empty else ["—"]
+    # Shared master frames / choice lists (cache_resource): read-only here, nothing unpickled per rerun
+    pharm_choices    = allowed_pharm_choices()
 
     # --- defaults / reset ---
     def _seed_defaults():
-        defaults = {
-            "employee_name": "",
-            "submission_date": date.today(),
-            "submission_mode": "",
-            "type": st.session_state.get("type", "Insurance"),
-            "pharmacy_display": "",
-            "portal": "",
-            "erx_number": "",
-            "insurance_display": "",
-            "member_id": "",
-            "eid": "",
-            "claim_id": "",
-            "approval_code": "",
-            "net_amount": 0.0,
-            "patient_share": 0.0,
-            "status": "",
-            "remark": "",
-            "allow_dup_override": False,
-            "_was_cash": st.session_state.get("_was_cash", False),
-        }
-        for k, v in defaults.items():
-            st.session_state.setdefault(k, v)
+        missing = _LEGACY_FORM_DEFAULTS.keys() - st.session_state.keys()
+        if missing:
+            st.session_state.update({k: _LEGACY_FORM_DEFAULTS[k] for k in missing})
+        if "submission_date" not in st.session_state:
+            st.session_state["submission_date"] = date.today()
 
     if st.session_state.get("_clear_form", False):
         for k in (
@@ -1633,7 +2125,7 @@ def _render_legacy_pharmacy_intake(sheet_name: str):
                 if st.session_state.get(k) == "Cash":
                     st.session_state[k] = ""
             if st.session_state.get("insurance_display") == "Cash":
-                base_ins = ins_df["Display"].tolist() if not ins_df.empty else [""]
+                base_ins = insurance_choices()
                 st.session_state["insurance_display"] = base_ins[0] if base_ins else ""
             st.session_state["_was_cash"] = False
 
@@ -1641,7 +2133,7 @@ def _render_legacy_pharmacy_intake(sheet_name: str):
         submodes_opts = list(submission_modes)
         portals_opts  = list(portals)
         if "_ins_opts_base" not in st.session_state:
-            st.session_state["_ins_opts_base"] = ins_df["Display"].tolist() if not ins_df.empty else ["—"]
+            st.session_state["_ins_opts_base"] = list(insurance_choices()) or ["—"]
         ins_opts = list(st.session_state["_ins_opts_base"])
         if type_is_cash:
             if "Cash" not in submodes_opts: submodes_opts.insert(0, "Cash")
@@ -1723,6 +2215,7 @@ def _render_legacy_pharmacy_intake(sheet_name: str):
         pg_append_row(sheet_name, row)   # "Data_Pharmacy" -> table data_pharmacy
     else:
         ws(sheet_name).append_row(list(row.values()), value_input_option="USER_ENTERED")
+    bump_module_version(sheet_name)
     
     flash("Saved to database.", "success")
    
@@ -1754,7 +2247,7 @@ def _render_legacy_pharmacy_intake(sheet_name: str):
     if " - " in st.session_state.pharmacy_display:
         ph_id, ph_name = st.session_state.pharmacy_display.split(" - ", 1)
         ph_id, ph_name = ph_id.strip(), ph_name.strip()
-    if ALLOWED_PHARM_IDS and ALLOWED_PHARM_IDS != ["ALL"] and ph_id not in ALLOWED_PHARM_IDS:
+    if _PHARM_RESTRICTED and ph_id not in _ALLOWED_SET:
         st.error("You are not allowed to submit for this pharmacy.")
         return
 
@@ -1772,19 +2265,20 @@ def _render_legacy_pharmacy_intake(sheet_name: str):
 
     # --- duplicate check (same-day ERX + Net) ---
     try:
-        df_dup = pd.DataFrame(retry(lambda: wsx.get_all_records()))
+        # Cached module frame (its version is bumped on every save) instead of get_all_records per submit
+        df_dup = read_sheet_df(sheet_name) if USE_POSTGRES else load_module_df(sheet_name)
         dup = False
         if not df_dup.empty:
-            df_dup["SubmissionDate"] = parse_date(df_dup.get("SubmissionDate")).dt.date
-            same_day = df_dup[df_dup["SubmissionDate"] == st.session_state.submission_date]
-            net_str = f"{float(st.session_state.net_amount):.2f}"
-            dup = (
-                same_day.get("ERXNumber", pd.Series([], dtype=str)).astype(str).str.strip()
-                .eq(str(st.session_state.erx_number).strip())
-                &
-                pd.to_numeric(same_day.get("NetAmount", 0), errors="coerce").fillna(0.0)
-                .map(lambda x: f"{x:.2f}").eq(net_str)
-            ).any()
+            # datetime64[D] compare; no per-row datetime.date objects
+            d = st.session_state.submission_date
+            same_day = df_dup[day_range_mask(parse_date(df_dup.get("SubmissionDate")), d, d)]
+            if "ERXNumber" in same_day.columns and "NetAmount" in same_day.columns:
+                erx_hit = (_as_text(same_day["ERXNumber"]).str.strip()
+                           .eq(str(st.session_state.erx_number).strip()).to_numpy(dtype=bool, na_value=False))
+                # Cents compare on the float block (was a per-row f"{x:.2f}" map)
+                net = pd.to_numeric(same_day["NetAmount"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+                net_hit = np.abs(np.round(net, 2) - round(float(st.session_state.net_amount), 2)) < 0.005
+                dup = bool((erx_hit & net_hit).any())
         if dup and not st.session_state.allow_dup_override and str(ROLE).strip().lower() not in ("super admin","superadmin"):
             st.warning("Possible duplicate for today (ERX + Net). Tick override to proceed.")
             return
@@ -1817,8 +2311,7 @@ def _render_legacy_pharmacy_intake(sheet_name: str):
 
     try:
         retry(lambda: wsx.append_row(record, value_input_option="USER_ENTERED"))
-        try: load_module_df.clear()
-        except Exception: pass
+        bump_module_version(sheet_name)
 
         st.session_state["_clear_form"] = True
         st.session_state[f"{module_key}_submission_type"] = "Insurance"
@@ -1886,10 +2379,7 @@ def _render_clinic_purchase_unified():
     status_df = read_sheet_df(MS_STATUS, ["Value"]).fillna("")
     status_opts = [str(x) for x in status_df["Value"].tolist() if str(x).strip()] or ["Submitted"]
 
-    ph_df = pharm_master()
-    if ALLOWED_PHARM_IDS and ALLOWED_PHARM_IDS != ["ALL"]:
-        ph_df = ph_df[ph_df["ID"].astype(str).isin([str(x) for x in ALLOWED_PHARM_IDS])]
-    pharm_choices = ph_df["Display"].tolist() if not ph_df.empty else ["—"]
+    pharm_ids = allowed_pharm_ids()
 
     CP_SHEET = (globals().get("CLINIC_PURCHASE_SHEET")
                 or globals().get("TAB_CP")
@@ -1955,7 +2445,7 @@ def _render_clinic_purchase_unified():
         st.markdown("### Clinic Purchase")
         st.caption("Create / update entry")
 
-        st.selectbox("Pharmacy (ID - Name)*", pharm_choices, key="cp_pharmacy_display")
+        st.selectbox("Pharmacy (ID - Name)*", pharm_ids, key="cp_pharmacy_id", format_func=_pharm_label)
         st.date_input("Date", value=st.session_state.get("cp_date") or date.today(), key="cp_date")
         st.text_input("Employee", value=st.session_state.get("cp_emp", ""), key="cp_emp")
 
@@ -2039,11 +2529,11 @@ def _render_clinic_purchase_unified():
         return
 
     # Validate pharmacy & ACL
-    ph_disp = st.session_state.get("cp_pharmacy_display", "")
-    if " - " not in ph_disp:
+    ph_id = st.session_state.get("cp_pharmacy_id", "")
+    ph_name = pharm_name_by_id().get(ph_id)
+    if ph_name is None:
         st.error("Please select a Pharmacy before submitting."); return
-    ph_id, ph_name = [x.strip() for x in ph_disp.split(" - ", 1)]
-    if ALLOWED_PHARM_IDS and ALLOWED_PHARM_IDS != ["ALL"] and ph_id not in [str(x) for x in ALLOWED_PHARM_IDS]:
+    if _PHARM_RESTRICTED and ph_id not in _ALLOWED_SET:
         st.error("You are not allowed to submit for this pharmacy."); return
 
     # Append rows + update opening stock
@@ -2085,6 +2575,7 @@ def _render_clinic_purchase_unified():
         any_saved = True
 
     if any_saved:
+        bump_module_version(CP_SHEET)
         st.success("Saved.")
         st.session_state["_cp_rows"] = [0]
         for k in [k for k in list(st.session_state.keys()) if k.startswith("cp_")]:
@@ -2092,6 +2583,74 @@ def _render_clinic_purchase_unified():
     else:
         st.info("Nothing to save (all lines were empty).")
 
+# ---- Dynamic form widgets, dispatched on the compiled field kind (see compiled_schema_for) ----
+def _date_default(f) -> date:
+    return f["dt"].date() if pd.notna(f["dt"]) else date.today()
+
+def _w_int(f, key, opts, module_name):
+    return st.number_input(f["label_req"], value=int(f["num"]), step=1, key=key)
+
+def _w_number(f, key, opts, module_name):
+    return st.number_input(f["label_req"], value=float(f["num"]), key=key)
+
+def _w_date(f, key, opts, module_name):
+    return st.date_input(f["label_req"], value=_date_default(f), key=key)
+
+def _w_select(f, key, opts, module_name):
+    wkey = f"{module_name}_submission_type" if f["key"] == "type" else key  # avoid using raw "type" as a key
+    if wkey not in st.session_state:
+        default = f["default"]
+        if default and default in opts:
+            st.session_state[wkey] = default
+        elif opts:
+            st.session_state[wkey] = opts[0]
+        else:
+            st.session_state[wkey] = ""
+    return st.selectbox(
+        f["label_req"],
+        opts,
+        index=(opts.index(st.session_state[wkey]) if st.session_state[wkey] in opts else 0 if opts else None),
+        key=wkey,
+    )
+
+def _w_multiselect(f, key, opts, module_name):
+    defaults = [o for o in opts if o in str(f["default"] or "").split(",")]
+    return st.multiselect(f["label_req"], opts, default=defaults, key=key)
+
+def _w_textarea(f, key, opts, module_name):
+    return st.text_area(f["label_req"], value=str(f["default"] or ""), key=key)
+
+def _w_text(f, key, opts, module_name):
+    return st.text_input(f["label_req"], value=str(f["default"] or ""), key=key)
+
+_FIELD_WIDGETS = {
+    "int": _w_int, "number": _w_number, "date": _w_date,
+    "select": _w_select, "multiselect": _w_multiselect,
+    "phone": _w_text, "textarea": _w_textarea, "text": _w_text,
+}
+
+# Read-only variants render a disabled control and return the value to save
+def _ro_int(f, key):
+    dv = int(f["num"])
+    st.number_input(f["label_req"], value=dv, step=1, min_value=0, key=key, disabled=True)
+    return dv
+
+def _ro_number(f, key):
+    dv = float(f["num"])
+    st.number_input(f["label_req"], value=dv, key=key, disabled=True)
+    return dv
+
+def _ro_date(f, key):
+    st.date_input(f["label_req"], value=_date_default(f), key=key, disabled=True)
+    return format_date(f["dt"]) if pd.notna(f["dt"]) else ""
+
+def _ro_text(f, key):
+    dv = str(f["default"] or "")
+    st.text_input(f["label_req"], value=dv, key=key, disabled=True)
+    return dv
+
+_RO_FIELD_WIDGETS = {"int": _ro_int, "number": _ro_number, "date": _ro_date}
+
 def _render_dynamic_form(module_name: str, sheet_name: str, client_id: str, role: str):
     """
     Dynamic form renderer (fixed):
@@ -2110,19 +2669,13 @@ def _render_dynamic_form(module_name: str, sheet_name: str, client_id: str, role
         return
 
     # Load schema rows
-    sdf = schema_df()
-    rows = (
-        sdf[(sdf["Module"] == module_name) & (sdf["ClientID"].isin([client_id, "DEFAULT", "ALL"]))]
-        .sort_values("Order")
-    )
+    rows = schema_rows_for(module_name, client_id)
     if rows.empty:
         seed_form_schema_for_module(module_name, client_id if client_id else "DEFAULT")
         schema_df.clear()
-        sdf = schema_df()
-        rows = (
-            sdf[(sdf["Module"] == module_name) & (sdf["ClientID"].isin([client_id, "DEFAULT", "ALL"]))]
-            .sort_values("Order")
-        )
+        schema_rows_for.clear()
+        compiled_schema_for.clear()
+        rows = schema_rows_for(module_name, client_id)
         if rows.empty:
             st.info("No schema configured for this module (add rows in FormSchema).")
             return
@@ -2130,6 +2683,8 @@ def _render_dynamic_form(module_name: str, sheet_name: str, client_id: str, role
     # Safe to use a normal button here (outside any form)
     if st.button("Reload schema", key=f"reload_schema_{module_name}"):
         schema_df.clear()
+        schema_rows_for.clear()
+        compiled_schema_for.clear()
         st.rerun()
 
     with intake_page(module_name, "Create / update entry", badge=role):
@@ -2141,118 +2696,38 @@ def _render_dynamic_form(module_name: str, sheet_name: str, client_id: str, role
         with frame:
             with st.form(f"dyn_form_{module_name}", clear_on_submit=True):
                 # Pharmacy selector at the top
-                ph_df = pharm_master()
-                if ALLOWED_PHARM_IDS and ALLOWED_PHARM_IDS != ["ALL"]:
-                    ph_df = ph_df[ph_df["ID"].isin(ALLOWED_PHARM_IDS)]
-                pharm_choices = ph_df["Display"].tolist() if not ph_df.empty else ["—"]
-                st.selectbox("Pharmacy (ID - Name)*", pharm_choices, key=f"{module_name}_pharmacy_display")
+                ph_ids = allowed_pharm_ids()
+                st.selectbox("Pharmacy (ID - Name)*", ph_ids, key=f"{module_name}_pharmacy_id", format_func=_pharm_label)
 
                 # Remember module + pharmacy id in session
                 st.session_state["_current_module"] = module_name
-                ph_disp = st.session_state.get(f"{module_name}_pharmacy_display", "")
-                st.session_state["_current_pharmacy_id"] = ph_disp.split(" - ", 1)[0].strip() if " - " in ph_disp else ""
+                ph_id = st.session_state.get(f"{module_name}_pharmacy_id", "")
+                st.session_state["_current_pharmacy_id"] = ph_id if ph_id in pharm_name_by_id() else ""
 
                 cols = st.columns(3, gap="large")
                 values = {}
 
+                # Options per token for this render pass (pharmacy and role are fixed within it)
+                opt_cache = {}
+
                 # ----- Render all fields from FormSchema (INSIDE THE FORM) -----
-                for i, (_, r) in enumerate(rows.iterrows()):
-                    if not _role_visible(r["RoleVisibility"], role):
-                        continue
-
-                    fkey     = r["FieldKey"]
-                    label    = r["Label"]
-                    typ      = (r["Type"] or "").lower().strip()
-                    required = bool(r["Required"])
-                    default  = r["Default"]
-                    opts     = _options_from_token(r["Options"])
-                    readonly = _is_readonly(r.get("ReadOnlyRoles", ""), role)
-
-                    # Clinic Purchase values are editable only in unified UI; keep RO here
-                    key       = f"{module_name}_{fkey}"
-                    label_req = label + ("*" if required else "")
-                    target    = cols[i % 3]
+                for f in compiled_schema_for(module_name, client_id, role):
+                    fkey, kind = f["key"], f["kind"]
+                    key        = f"{module_name}_{fkey}"
+                    target     = cols[f["i"] % 3]
 
                     with target:
-                        if readonly:
+                        if f["readonly"]:
                             # render disabled controls but still capture a value
-                            if typ in ("integer", "int") or _is_int_field(fkey):
-                                try:
-                                    dv = int(float(default)) if str(default).strip() else 0
-                                except Exception:
-                                    dv = 0
-                                st.number_input(label_req, value=int(dv), step=1, min_value=0, key=key+"_ro", disabled=True)
-                                values[fkey] = dv
-                            elif typ == "number":
-                                try:
-                                    dv = float(default) if str(default).strip() else 0.0
-                                except Exception:
-                                    dv = 0.0
-                                st.number_input(label_req, value=float(dv), key=key+"_ro", disabled=True)
-                                values[fkey] = dv
-                            elif typ == "date":
-                                d = parse_date(default)
-                                st.date_input(label_req, value=(d.date() if pd.notna(d) else date.today()), key=key+"_ro", disabled=True)
-                                values[fkey] = format_date(d) if pd.notna(d) else ""
-                            elif typ in ("phone", "tel") or _is_phone_field(fkey):
-                                st.text_input(label_req, value=str(default or ""), key=key+"_ro", disabled=True)
-                                values[fkey] = str(default or "")
-                            else:
-                                st.text_input(label_req, value=str(default or ""), key=key+"_ro", disabled=True)
-                                values[fkey] = str(default or "")
+                            values[fkey] = _RO_FIELD_WIDGETS.get(kind, _ro_text)(f, key + "_ro")
                             continue
-
-                        # editable widgets
-                        if typ in ("integer", "int") or _is_int_field(fkey):
-                            try:
-                                dv = int(float(default)) if str(default).strip() else 0
-                            except Exception:
-                                dv = 0
-                            values[fkey] = st.number_input(label_req, value=int(dv), step=1, key=key)
-
-                        elif typ == "number":
-                            try:
-                                dv = float(default) if str(default).strip() else 0.0
-                            except Exception:
-                                dv = 0.0
-                            values[fkey] = st.number_input(label_req, value=float(dv), key=key)
-
-                        elif typ == "date":
-                            d = parse_date(default)
-                            values[fkey] = st.date_input(label_req, value=(d.date() if pd.notna(d) else date.today()), key=key)
-
-                        elif typ == "select":
-                            wkey = f"{module_name}_{fkey}"
-                            if fkey == "type":  # avoid using raw "type" as a key
-                                wkey = f"{module_name}_submission_type"
-
-                            if wkey not in st.session_state:
-                                if default and default in opts:
-                                    st.session_state[wkey] = default
-                                elif opts:
-                                    st.session_state[wkey] = opts[0]
-                                else:
-                                    st.session_state[wkey] = ""
-
-                            values[fkey] = st.selectbox(
-                                label_req,
-                                opts,
-                                index=(opts.index(st.session_state[wkey]) if st.session_state[wkey] in opts else 0 if opts else None),
-                                key=wkey,
-                            )
-
-                        elif typ == "multiselect":
-                            defaults = [o for o in opts if o in str(default or "").split(",")]
-                            values[fkey] = st.multiselect(label_req, opts, default=defaults, key=key)
-
-                        elif typ in ("phone", "tel") or _is_phone_field(fkey):
-                            values[fkey] = st.text_input(label_req, value=str(default or ""), key=key)
-
-                        elif typ == "textarea":
-                            values[fkey] = st.text_area(label_req, value=str(default or ""), key=key)
-
-                        else:
-                            values[fkey] = st.text_input(label_req, value=str(default or ""), key=key)
+                        # Only list widgets need their options resolved
+                        opts = None
+                        if kind in ("select", "multiselect"):
+                            opts = opt_cache.get(f["options"])
+                            if opts is None:
+                                opts = opt_cache[f["options"]] = _options_from_token(f["options"])
+                        values[fkey] = _FIELD_WIDGETS[kind](f, key, opts, module_name)
 
                 # duplicate override (inside the form is fine)
                 dup_override_key = f"{module_name}_dup_override"
@@ -2263,42 +2738,56 @@ def _render_dynamic_form(module_name: str, sheet_name: str, client_id: str, role
         return
 
     # require pharmacy
-    ph_disp = st.session_state.get(f"{module_name}_pharmacy_display", "")
-    if " - " not in ph_disp:
+    ph_id = st.session_state.get(f"{module_name}_pharmacy_id", "")
+    ph_name = pharm_name_by_id().get(ph_id)
+    if ph_name is None:
         st.error("Please select a Pharmacy before submitting.")
         return
-    ph_id, ph_name = [x.strip() for x in ph_disp.split(" - ", 1)]
-    if ALLOWED_PHARM_IDS and ALLOWED_PHARM_IDS != ["ALL"] and ph_id not in [str(x) for x in ALLOWED_PHARM_IDS]:
+    if _PHARM_RESTRICTED and ph_id not in _ALLOWED_SET:
         st.error("You are not allowed to submit for this pharmacy.")
         return
 
     # make sure values["type"] reflects select widget (namespaced)
     values["type"] = st.session_state.get(f"{module_name}_submission_type", values.get("type", ""))
 
-    # validate required fields
+    # One pass over the compiled fields: required check + save-value conversion (fk -> (column, value))
     missing = []
-    for _, r in rows.iterrows():
-        if not _role_visible(r["RoleVisibility"], role):
-            continue
-        if bool(r["Required"]):
-            v = values.get(r["FieldKey"])
-            if v is None or (isinstance(v, str) and not v.strip()) or (isinstance(v, list) and not v):
-                missing.append(r["Label"])
+    out = {}
+    for f in compiled_schema_for(module_name, client_id, role):
+        fk, kind = f["key"], f["kind"]
+        val = values.get(fk)
+        if f["required"] and (val is None or (isinstance(val, str) and not val.strip()) or (isinstance(val, list) and not val)):
+            missing.append(f["label"])
+        if f["type"] == "date" and isinstance(val, (date, datetime)):  # read-only dates arrive pre-formatted
+            val = format_date(val)
+        if f["type"] == "multiselect" and isinstance(val, list):  # read-only multiselects render as text
+            val = ", ".join(str(x) for x in val)
+        if fk in ("net_amount", "patient_share") and isinstance(val, float):
+            val = f"{val:.2f}"
+        if kind == "int":
+            if str(val).strip() != "":
+                try: val = str(int(float(val)))
+                except Exception: val = ""
+        if f["phone"]:
+            phone = _PHONE_STRIP_RE.sub("", str(val))
+            val = f"'{phone}" if phone else ""
+        out[fk] = (f["save_to"], val)
     if missing:
         st.error("Missing required fields: " + ", ".join(missing))
         return
 
     # ensure headers on target sheet
     meta = ["Timestamp","SubmittedBy","Role","ClientID","PharmacyID","PharmacyName","Module","RecordID"]
-    save_map = {r["FieldKey"]: (r["SaveTo"] or r["FieldKey"]) for _, r in rows.iterrows()
-                if _role_visible(r["RoleVisibility"], role)}
-    target_headers = meta + list(dict.fromkeys(save_map.values()))
+    target_headers = meta + list(dict.fromkeys(col for col, _ in out.values()))
     wsx = ws(sheet_name)
     head = retry(lambda: wsx.row_values(1))
-    if [h.lower() for h in head] != [h.lower() for h in target_headers]:
+    if tuple(h.lower() for h in head) != tuple(h.lower() for h in target_headers):
         existing = [h for h in head if h]
-        merged = list(dict.fromkeys((existing or []) + target_headers))
-        retry(lambda: wsx.update("A1", [merged]))
+        seen = set(existing)
+        added = [h for h in dict.fromkeys(target_headers) if h not in seen]
+        merged = existing + added
+        if added or len(existing) != len(head):  # only write when the header row actually changes
+            retry(lambda: wsx.update("A1", [merged]))
         target_headers = merged
 
     # build row for save
@@ -2312,25 +2801,7 @@ def _render_dynamic_form(module_name: str, sheet_name: str, client_id: str, role
         "Module": module_name,
         "RecordID": str(uuid.uuid4()),
     }
-    typ_map = { rr["FieldKey"]: str(rr["Type"]).lower().strip() for _, rr in rows.iterrows() }
-
-    for fk, col in save_map.items():
-        val = values.get(fk)
-        if isinstance(val, (date, datetime)):
-            val = format_date(val)
-        if isinstance(val, list):
-            val = ", ".join([str(x) for x in val])
-        if isinstance(val, float) and fk in {"net_amount","patient_share"}:
-            try: val = f"{float(val):.2f}"
-            except Exception: pass
-        if typ_map.get(fk) in ("integer", "int") or _is_int_field(fk):
-            if str(val).strip() != "":
-                try: val = str(int(float(val)))
-                except Exception: val = ""
-        if typ_map.get(fk) in ("phone","tel") or _is_phone_field(fk):
-            phone = re.sub(r"[^0-9+]", "", str(val))
-            val = f"'{phone}" if phone else ""
-        data_map[col] = val
+    data_map.update(out.values())
 
     # duplicate check
     try:
@@ -2344,18 +2815,17 @@ def _render_dynamic_form(module_name: str, sheet_name: str, client_id: str, role
         st.info(f"Duplicate check skipped: {e}")
 
     # save
+    raw_map = dict(data_map)
     for k in list(data_map.keys()):
         if isinstance(data_map[k], str):
             data_map[k] = _sanitize_cell(data_map[k])
     row = [data_map.get(h, "") for h in target_headers]
     try:
         retry(lambda: wsx.append_row(row, value_input_option="USER_ENTERED"))
+        _remember_duplicate_key(sheet_name, module_name, raw_map)
+        bump_module_version(sheet_name)  # before flash(): its st.rerun() ends this run
         flash("Saved ✔️", "success")
         _clear_module_form_state(module_name, rows)
-        try:
-            load_module_df.clear()
-        except Exception:
-            pass
     except Exception as e:
         st.error(f"Save failed: {e}")
 
@@ -2373,13 +2843,13 @@ def _render_view_export_page():
         sheet = dict(cat_pairs)[mod]
 
         # 🔐 Same visibility rules as Update Record
-        df = _apply_common_filters(load_module_df(sheet), scope_to_user=True)
+        df = _apply_common_filters(load_module_df(sheet), scope_to_user=True, sheet_name=sheet)
         if df.empty:
             st.info("No data found for your scope."); return
 
         # ---- column resolver (tolerant to header variants) ----
+        lowmap = {c.strip().lower(): c for c in df.columns}  # built once per page run, not per lookup
         def _find_col(cands: list[str]) -> str | None:
-            lowmap = {c.strip().lower(): c for c in df.columns}
             for c in cands:
                 k = c.strip().lower()
                 if k in lowmap:
@@ -2394,6 +2864,7 @@ def _render_view_export_page():
         col_ins      = _find_col(["InsuranceName","Insurance","Insurance Code","InsuranceCode"])
         col_status   = _find_col(["Status","ApprovalStatus","Final Status","FinalStatus"])
         col_date     = _find_col(["SubmissionDate","Date"])
+        sdt = parse_date(df[col_date]) if col_date else None  # parsed once: date widgets + mask
 
         # ---- Filters UI (same shape as Update Record) ----
         with st.expander("Filters", expanded=True):
@@ -2402,9 +2873,8 @@ def _render_view_export_page():
                 q = st.text_input("Search (matches any column)", key="view_q")
                 use_date = st.checkbox("Filter by date range", value=False, key="view_use_date")
                 if use_date and col_date:
-                    sd = parse_date(df[col_date]).dt.date
-                    d1 = st.date_input("From", sd[sd.notna()].min() if sd.notna().any() else date.today(), key="view_d1")
-                    d2 = st.date_input("To",   sd[sd.notna()].max() if sd.notna().any() else date.today(), key="view_d2")
+                    d1 = st.date_input("From", sdt.min().date() if sdt.notna().any() else date.today(), key="view_d1")
+                    d2 = st.date_input("To",   sdt.max().date() if sdt.notna().any() else date.today(), key="view_d2")
             with c2:
                 f_claim   = st.text_input("Claim ID", key="view_claim") if col_claim else ""
                 f_eid     = st.text_input("EID", key="view_eid") if col_eid else ""
@@ -2415,16 +2885,16 @@ def _render_view_export_page():
                 f_insurance= st.text_input("Insurance (text match)", key="view_insurance") if col_ins else ""
                 f_status = ""
                 if col_status:
-                    opts = [""] + sorted([x for x in df[col_status].astype(str).unique() if x])
+                    opts = [""] + column_options(df, sheet, col_status, scope_to_user=True)
                     f_status = st.selectbox("Status", opts, index=0, key="view_status")
 
         # ---- Safe mask builder (no KeyErrors when blanks) ----
-        mask = pd.Series(True, index=df.index)
+        mask = np.ones(len(df), dtype=bool)
 
         def _and_contains(col: str | None, needle: str):
             nonlocal mask
             if col and needle and needle.strip():
-                mask &= df[col].astype(str).str.contains(re.escape(needle.strip()), case=False, na=False)
+                mask &= _as_text(df[col]).str.contains(re.escape(needle.strip()), case=False, na=False).to_numpy()
 
         _and_contains(col_claim,    f_claim)
         _and_contains(col_eid,      f_eid)
@@ -2434,15 +2904,15 @@ def _render_view_export_page():
         _and_contains(col_ins,      f_insurance)
 
         if col_status and f_status:
-            mask &= (df[col_status].astype(str).str.lower() == f_status.lower())
+            mask &= (_as_text(df[col_status]).str.lower() == f_status.lower()).to_numpy()
 
         if 'use_date' in locals() and use_date and col_date:
-            sd = parse_date(df[col_date]).dt.date
-            mask &= sd.between(d1, d2)
+            mask &= day_range_mask(sdt, d1, d2)
 
         if q.strip():
-            esc = re.escape(q.strip())
-            mask &= df.apply(lambda r: r.astype(str).str.contains(esc, case=False, na=False).any(), axis=1)
+            # any-column search = one literal scan over the cached joined row text
+            hay = lowered_search_text(df, sheet, tuple(dict.fromkeys(df.columns)))
+            mask &= hay.str.contains(q.strip().lower(), regex=False, na=False).to_numpy()
 
         df = df[mask]
         for _col in ("NetAmount", "PatientShare"):
@@ -2458,7 +2928,7 @@ def _render_view_export_page():
             st.download_button("Download CSV", csv, f"{mod}_export.csv", "text/csv", key="view_dl")
 
         if st.button("Refresh data", key="view_refresh"):
-            load_module_df.clear(); st.rerun()
+            bump_module_version(sheet); st.rerun()
 
 
 def _render_email_whatsapp_page():
@@ -2691,19 +3161,19 @@ def _render_masters_admin_page():
             st.subheader("Simple Lists")
             t1, t2, t3 = st.columns(3)
             with t1:
-                sdf = _load_for_editor(MS_SUBMISSION_MODE, REQUIRED_HEADERS[MS_SUBMISSION_MODE])
+                sdf = pd.DataFrame({"Value": masters_batch().get(MS_SUBMISSION_MODE, [])})
                 e1 = _data_editor(sdf, "ed_sm")
                 if st.button("Save Submission Modes", key="btn_save_sm"):
                     if _save_whole_sheet(MS_SUBMISSION_MODE, e1, REQUIRED_HEADERS[MS_SUBMISSION_MODE]):
                         _clear_all_caches(); st.success("Submission modes saved.")
             with t2:
-                pdf = _load_for_editor(MS_PORTAL, REQUIRED_HEADERS[MS_PORTAL])
+                pdf = pd.DataFrame({"Value": masters_batch().get(MS_PORTAL, [])})
                 e2 = _data_editor(pdf, "ed_portal")
                 if st.button("Save Portals", key="btn_save_portal"):
                     if _save_whole_sheet(MS_PORTAL, e2, REQUIRED_HEADERS[MS_PORTAL]):
                         _clear_all_caches(); st.success("Portals saved.")
             with t3:
-                s2 = _load_for_editor(MS_STATUS, REQUIRED_HEADERS[MS_STATUS])
+                s2 = pd.DataFrame({"Value": masters_batch().get(MS_STATUS, [])})
                 e3 = _data_editor(s2, "ed_status")
                 if st.button("Save Status", key="btn_save_status"):
                     if _save_whole_sheet(MS_STATUS, e3, REQUIRED_HEADERS[MS_STATUS]):
@@ -2749,9 +3219,11 @@ def _render_masters_admin_page():
                     _ensure_module_sheets_exist()
                     # seed missing schema for currently selected client
                     cat = modules_catalog_df()
-                    for _, r in cat.iterrows():
-                        seed_form_schema_for_module(str(r["Module"]), CLIENT_ID)
+                    for m in cat["Module"].astype(str):
+                        seed_form_schema_for_module(m, CLIENT_ID)
                     schema_df.clear()
+                    schema_rows_for.clear()
+                    compiled_schema_for.clear()
                     st.success("Reconciled. Missing sheets created; schema seeded where needed.")
 
         # ---------- Client Modules ----------
@@ -2803,7 +3275,7 @@ def _render_masters_admin_page():
             if sel_client != "<All>": mask &= (sdf_all["ClientID"].astype(str) == sel_client)
             if sel_module != "<All>": mask &= (sdf_all["Module"].astype(str) == sel_module)
 
-            subset = sdf_all[mask].copy().sort_values(["ClientID","Module","Order","FieldKey"])
+            subset = sdf_all[mask].sort_values(["ClientID","Module","Order","FieldKey"])
             colconf = {
                 "ClientID":       st.column_config.TextColumn("ClientID", required=True),
                 "Module":         st.column_config.TextColumn("Module", required=True),
@@ -2832,7 +3304,7 @@ def _render_masters_admin_page():
             with s1:
                 if st.button("Save Edited Subset", type="primary", key="btn_save_schema_subset", disabled=bool(problems)):
                     # merge with untouched rows
-                    remainder = sdf_all[~mask].copy()
+                    remainder = sdf_all[~mask]
                     merged = pd.concat([remainder, edited], ignore_index=True)
                     # sort for determinism
                     merged = merged.sort_values(["ClientID","Module","Order","FieldKey"])
@@ -2851,6 +3323,8 @@ def _render_masters_admin_page():
                     else:
                         seed_form_schema_for_module(target_module, target_client or "DEFAULT")
                         schema_df.clear()
+                        schema_rows_for.clear()
+                        compiled_schema_for.clear()
                         st.success("Seeded missing fields for selection.")
 
 def _render_bulk_import_insurance_page():
@@ -2867,12 +3341,99 @@ def _render_bulk_import_insurance_page():
                 w.clear()
             except Exception:
                 w.batch_clear(["A:Z"])
-            w.update("A1", data)
+            retry(lambda: w.update("A1", data, value_input_option="RAW"))
             st.success(f"Imported {len(df)} rows.")
             insurance_master.clear()
+            insurance_choices.clear()
         except Exception as e:
             st.error(f"Import failed: {e}")
 
+def _xlsx_bytes(df: pd.DataFrame, sheet_name: str = "Data") -> bytes:
+    """Serialize one DataFrame to .xlsx with xlsxwriter (no URL detection on text cells)."""
+    out = io.BytesIO()
+    with pd.ExcelWriter(out, engine="xlsxwriter", engine_kwargs={"options": {"strings_to_urls": False}}) as xw:
+        df.to_excel(xw, sheet_name=(sheet_name or "Data")[:31], index=False)
+    return out.getvalue()
+
+def _xlsx_stream_bytes(df: pd.DataFrame, sheet_name: str = "Data") -> bytes:
+    """Row-streamed .xlsx: header + itertuples rows straight into an xlsxwriter constant_memory sheet.
+    Each row is flushed as it is written (pandas' to_excel emits cells column by column, which
+    constant_memory cannot take), so wide frames never sit in RAM as per-cell objects."""
+    import xlsxwriter
+    out = io.BytesIO()
+    wb = xlsxwriter.Workbook(out, {"constant_memory": True, "strings_to_urls": False,
+                                   "default_date_format": "yyyy-mm-dd"})
+    wsx = wb.add_worksheet((sheet_name or "Data")[:31])
+    wsx.write_row(0, 0, [str(c) for c in df.columns], wb.add_format({"bold": True}))
+    for i, row in enumerate(df.itertuples(index=False, name=None), start=1):
+        wsx.write_row(i, 0, row)
+    wb.close()
+    return out.getvalue()
+
+@st.cache_data(ttl=45, show_spinner=False, max_entries=32)
+def _numeric_probe_columns(sheet_name: str, version: int) -> tuple:
+    """Columns with at least one numeric cell in the first 200 rows (one columnar pass).
+    Keyed on the sheet's write version, so a save re-probes on the next rerun."""
+    raw = load_module_df(sheet_name)
+    if raw.empty:
+        return ()
+    probe = raw.head(200).apply(pd.to_numeric, errors="coerce")
+    return tuple(probe.columns[probe.notna().any().to_numpy()])
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _summary_pivot(frame: pd.DataFrame) -> pd.DataFrame:
+    """Mode → Date × Pharmacy pivot (subtotals + grand total).
+    `frame` holds _Mode/_Date/_Pharm and, when summing a field, _val; it is hashed as the
+    cache key, so reruns with unchanged filters skip the pivot."""
+    # groupby + unstack: one grouped reduction, none of pivot_table's margins/reshape machinery
+    grouped = frame.groupby(["_Mode","_Date","_Pharm"], observed=True, sort=False)
+    # row count / field sum; sums are rounded to cents once here, so subtotals and the grand
+    # total add up exactly the figures shown on the date rows
+    agg = grouped.size() if "_val" not in frame.columns else grouped["_val"].sum().round(2)
+    base = agg.unstack("_Pharm", fill_value=0).sort_index(level=[0,1])
+    # plain string labels (so the reset_index columns can join them), ordered alphabetically
+    base.columns = base.columns.astype(str)
+    base = base.sort_index(axis=1)
+    if base.empty:
+        # e.g. every _Date is NaT (groupby drops NaT keys): an empty table, as pivot_table gave
+        return pd.DataFrame(columns=["SubmissionMode", "SubmissionDate"])
+
+    # Per-mode subtotals: base is sorted by mode, so each mode is one contiguous run of rows
+    # and np.add.reduceat sums every run in a single C pass (no second groupby)
+    codes = base.index.codes[0]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    sizes = np.diff(np.r_[starts, len(base)])
+    body = np.ascontiguousarray(base.to_numpy())  # row runs want C order; no copy when the block already is
+    subs = pd.DataFrame(
+        np.add.reduceat(body, starts, axis=0), columns=base.columns,
+        index=pd.MultiIndex.from_arrays([base.index.get_level_values(0)[starts], ["— Total —"] * len(starts)], names=base.index.names),
+    )
+
+    # Grand total: a sum over the M subtotal rows, not the N date rows again
+    grand = subs.sum(axis=0).to_frame().T
+    grand.index = pd.MultiIndex.from_tuples([("Grand Total","")], names=base.index.names)
+
+    # One concat of [subtotals, dates, grand], then one positional take that puts each
+    # "— Total —" row ahead of its mode's dates and the grand total last
+    m, n = len(sizes), len(base)
+    order = np.empty(m + n + 1, dtype=np.intp)
+    order[np.cumsum(sizes) - sizes + np.arange(m)] = np.arange(m)
+    order[np.arange(n) + np.repeat(np.arange(m), sizes) + 1] = m + np.arange(n)
+    order[-1] = m + n
+    combined = pd.concat([subs, base, grand]).take(order)
+
+    # Flatten the row index in place: two inserted label columns instead of reset_index's
+    # copy of the whole pivot block
+    levels = combined.index
+    combined.index = pd.RangeIndex(len(combined))
+    combined.insert(0, "SubmissionDate", levels.get_level_values(1))
+    combined.insert(0, "SubmissionMode", levels.get_level_values(0))
+    return combined
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _summary_xlsx(pvt: pd.DataFrame) -> bytes:
+    return _xlsx_stream_bytes(pvt, "Summary")
+
 def _render_summary_page():
     with intake_page("Summary", "Submission Mode → Date × Pharmacy (subtotals + grand total)", badge=ROLE):
         if not module_pairs:
@@ -2889,13 +3450,13 @@ def _render_summary_page():
 
         
         # 2) Load + scope (client + pharmacies + per-user like Update Record)
-        df = _apply_common_filters(load_module_df(sheet), scope_to_user=True)
-        if df is None or df.empty:
+        df = _apply_common_filters(load_module_df(sheet), scope_to_user=True, sheet_name=sheet)
+        if df is None or len(df) == 0:
             st.info("No data found for your scope."); return
 
         # 3) Column resolver (tolerant to variants / missing headers)
+        lowmap = {c.strip().lower(): c for c in df.columns}  # built once per page run, not per lookup
         def _find_col(cands: list[str]) -> str | None:
-            lowmap = {c.strip().lower(): c for c in df.columns}
             for c in cands:
                 k = c.strip().lower()
                 if k in lowmap:
@@ -2915,8 +3476,9 @@ def _render_summary_page():
         col_ins_code = _find_col(["InsuranceCode","Insurance Code"])
 
         # safe defaults for pivot axes
-        if not col_pharm: df["PharmacyName"] = "Unknown"; col_pharm = "PharmacyName"
-        if not col_mode:  df["SubmissionMode"] = "Unknown"; col_mode = "SubmissionMode"
+        # missing pivot axes are "Unknown" everywhere: kept as flags, never broadcast into N-row columns
+        pharm_synth, mode_synth = not col_pharm, not col_mode
+        sdt = parse_date(df[col_date]) if col_date else None  # parsed once: widgets, mask, pivot
 
         # 4) Filters UI (exactly like Update Record) + pharmacy + date + global search
         with st.expander("Filters", expanded=True):
@@ -2925,9 +3487,8 @@ def _render_summary_page():
                 q = st.text_input("Search (matches any column)", key="sum_q")
                 use_date = st.checkbox("Filter by date range", value=False, key="sum_use_date")
                 if use_date and col_date:
-                    sd = parse_date(df[col_date]).dt.date
-                    d1 = st.date_input("From", sd[sd.notna()].min() if sd.notna().any() else date.today(), key="sum_d1")
-                    d2 = st.date_input("To",   sd[sd.notna()].max() if sd.notna().any() else date.today(), key="sum_d2")
+                    d1 = st.date_input("From", sdt.min().date() if sdt.notna().any() else date.today(), key="sum_d1")
+                    d2 = st.date_input("To",   sdt.max().date() if sdt.notna().any() else date.today(), key="sum_d2")
             with c2:
                 f_claim   = st.text_input("Claim ID", key="sum_claim") if col_claim else ""
                 f_eid     = st.text_input("EID", key="sum_eid") if col_eid else ""
@@ -2938,20 +3499,20 @@ def _render_summary_page():
                 f_insurance= st.text_input("Insurance (name/code contains)", key="sum_insurance") if (col_ins_name or col_ins_code) else ""
                 f_status = ""
                 if col_status:
-                    opts = [""] + sorted([x for x in df[col_status].astype(str).unique() if x])
+                    opts = [""] + column_options(df, sheet, col_status, scope_to_user=True)
                     f_status = st.selectbox("Status", opts, index=0, key="sum_status")
 
             # Pharmacy multi-select (from currently scoped df)
-            ph_opts = sorted([x for x in df[col_pharm].astype(str).unique() if x]) if col_pharm else []
+            ph_opts = ["Unknown"] if pharm_synth else column_options(df, sheet, col_pharm, scope_to_user=True)
             sel_pharm = st.multiselect("Pharmacy", ph_opts, key="sum_pharm")
 
         # 5) Apply filters safely (no KeyErrors if blank/missing)
-        mask = pd.Series(True, index=df.index)
+        mask = np.ones(len(df), dtype=bool)
 
         def _and_contains(col: str | None, needle: str):
             nonlocal mask
             if col and needle and needle.strip():
-                mask &= df[col].astype(str).str.contains(re.escape(needle.strip()), case=False, na=False)
+                mask &= _as_text(df[col]).str.contains(re.escape(needle.strip()), case=False, na=False).to_numpy()
 
         _and_contains(col_claim,    f_claim)
         _and_contains(col_eid,      f_eid)
@@ -2960,36 +3521,34 @@ def _render_summary_page():
         _and_contains(col_member,   f_member)
 
         # insurance contains (name OR code)
-        if f_insurance and (col_ins_name or col_ins_code):
-            ins_mask = pd.Series(False, index=df.index)
-            if col_ins_name:
-                ins_mask |= df[col_ins_name].astype(str).str.contains(re.escape(f_insurance.strip()), case=False, na=False)
-            if col_ins_code:
-                ins_mask |= df[col_ins_code].astype(str).str.contains(re.escape(f_insurance.strip()), case=False, na=False)
-            mask &= ins_mask
+        if f_insurance and f_insurance.strip() and (col_ins_name or col_ins_code):
+            # one literal scan over the pre-lowered "name\x1fcode" column built at load
+            hay = lowered_search_text(df, sheet, tuple(c for c in (col_ins_name, col_ins_code) if c))
+            mask &= hay.str.contains(f_insurance.strip().lower(), regex=False, na=False).to_numpy()
 
         if col_status and f_status:
-            mask &= (df[col_status].astype(str).str.lower() == f_status.lower())
+            mask &= (_as_text(df[col_status]).str.lower() == f_status.lower()).to_numpy()
 
-        if sel_pharm:
-            mask &= df[col_pharm].astype(str).isin(sel_pharm)
+        if sel_pharm and not pharm_synth:  # a synthesized axis only offers "Unknown", which every row has
+            mask &= _as_text(df[col_pharm]).isin(set(sel_pharm)).to_numpy()
 
         if 'use_date' in locals() and use_date and col_date:
-            sd = parse_date(df[col_date]).dt.date
-            mask &= sd.between(d1, d2)
+            mask &= day_range_mask(sdt, d1, d2)
 
-        if q.strip():
-            esc = re.escape(q.strip())
-            mask &= df.apply(lambda r: r.astype(str).str.contains(esc, case=False, na=False).any(), axis=1)
+        # any-column search = one literal scan over the cached joined row text
+        if q.strip() and mask.any():
+            hay = lowered_search_text(df, sheet, tuple(dict.fromkeys(df.columns)))
+            mask &= hay.str.contains(q.strip().lower(), regex=False, na=False).to_numpy()
 
-        df = df[mask].copy()
-        if df.empty:
+        if not mask.any():
             st.warning("No rows match the filters."); return
+        df = df[mask].copy()
 
         # 6) Quick metrics for the filtered set (keeps current Summary feel)
         total_rows = len(df)
-        approved = int((df.get(col_status, "").astype(str).str.lower() == "approved").sum()) if col_status else 0
-        pending  = int((df.get(col_status, "").astype(str).str.lower() == "pending").sum())  if col_status else 0
+        status_lc = _as_text(df[col_status]).str.lower() if col_status else None  # Arrow column, lowered once
+        approved = int((status_lc == "approved").sum()) if col_status else 0
+        pending  = int((status_lc == "pending").sum())  if col_status else 0
         m1, m2, m3 = st.columns(3)
         m1.metric("Total rows", total_rows)
         m2.metric("Approved", approved)
@@ -3003,88 +3562,49 @@ def _render_summary_page():
         if "NetAmount" in df.columns:
             preferred = "NetAmount"; value_options.append("NetAmount")
         else:
-            try:
-                row = cat[cat["Module"] == mod]
-                nums = json.loads(row.iloc[0]["NumericFieldsJSON"]) if not row.empty else []
-                for c in nums:
-                    if c in df.columns and c not in value_options:
-                        value_options.append(c)
-                        if preferred is None: preferred = c
-            except Exception:
-                pass
-            # auto-detect other numeric-ish columns
-            for c in df.columns:
-                if c in ("Timestamp", col_date, col_pharm, col_mode, col_status, col_claim, col_eid, col_patient, col_approval, col_member): 
-                    continue
-                ser = pd.to_numeric(df[c], errors="coerce")
-                if ser.notna().any() and c not in value_options:
+            row = cat[cat["Module"] == mod]
+            for c in (row.iloc[0]["_NumericFields"] if not row.empty else ()):
+                if c in df.columns and c not in value_options:
                     value_options.append(c)
                     if preferred is None: preferred = c
+            # auto-detect other numeric-ish columns
+            skip = {"Timestamp", col_date, col_pharm, col_mode, col_status, col_claim, col_eid, col_patient, col_approval, col_member}
+            for c in _numeric_probe_columns(sheet, _module_versions().get(sheet, 0)):
+                if c in skip or c not in df.columns or c in value_options:
+                    continue
+                value_options.append(c)
+                if preferred is None: preferred = c
 
         summarize_by = st.selectbox("Summarize by", value_options, index=(value_options.index(preferred) if preferred in value_options else 0), key="sum_value_by")
 
         # 8) Normalize types needed for pivot
         if col_date:
-            df["_Date"] = parse_date(df[col_date]).dt.date
+            df["_Date"] = sdt[mask].dt.date
         else:
             df["_Date"] = date.today()  # dummy single date if missing
-        df["_Mode"]  = df[col_mode].replace("", "Unknown") if col_mode else "Unknown"
-        df["_Pharm"] = df[col_pharm].replace("", "Unknown") if col_pharm else "Unknown"
+        # One pass per real column; synthesized all-"Unknown" columns become a scalar fill
+        df["_Mode"]  = "Unknown" if mode_synth else df[col_mode].replace("", "Unknown")
+        df["_Pharm"] = "Unknown" if pharm_synth else df[col_pharm].replace("", "Unknown")
 
         # 9) Build pivot (SubmissionMode → SubmissionDate × PharmacyName) with per-mode subtotal + grand total
-        def _build_pivot(values_col: str | None):
-            if values_col is None:  # row count
-                base = pd.pivot_table(
-                    df, index=["_Mode","_Date"], columns="_Pharm",
-                    aggfunc="size", fill_value=0
-                ).sort_index(level=[0,1])
-            else:
-                vals = pd.to_numeric(df[values_col], errors="coerce").fillna(0.0)
-                tmp = df.copy(); tmp["_val"] = vals
-                base = pd.pivot_table(
-                    tmp, index=["_Mode","_Date"], columns="_Pharm",
-                    values="_val", aggfunc="sum", fill_value=0.0
-                ).sort_index(level=[0,1])
-            # order columns alphabetically
-            base = base.reindex(sorted(base.columns, key=lambda x: str(x)), axis=1)
-
-            # Per-mode subtotal
-            blocks = []
-            for mode, chunk in base.groupby(level=0, sort=False):
-                subtotal = pd.DataFrame([chunk.sum(numeric_only=True)])
-                subtotal.index = pd.MultiIndex.from_tuples([(mode, "— Total —")], names=base.index.names)
-                blocks.append(pd.concat([subtotal, chunk]))
-            combined = pd.concat(blocks) if blocks else base
-
-            # Grand total
-            grand = pd.DataFrame([base.sum(numeric_only=True)])
-            grand.index = pd.MultiIndex.from_tuples([("Grand Total","")], names=base.index.names)
-            combined = pd.concat([combined, grand])
-
-            combined = combined.reset_index().rename(columns={"_Mode":"SubmissionMode","_Date":"SubmissionDate"})
-            num_cols = [c for c in combined.columns if c not in ("SubmissionMode","SubmissionDate")]
-            # nice rounding only for floats
-            for c in num_cols:
-                if pd.api.types.is_float_dtype(combined[c]):
-                    combined[c] = combined[c].round(2)
-            return combined
-
         value_col = None if summarize_by == "Row count" else summarize_by
-        pvt = _build_pivot(value_col)
+        # Categorical axes: the pivot groups on small int codes instead of hashing strings per row
+        frame = df[["_Mode","_Date","_Pharm"]].astype({"_Mode": "category", "_Pharm": "category"})
+        if value_col is not None:
+            frame = frame.assign(_val=pd.to_numeric(df[value_col], errors="coerce").fillna(0.0))
+        pvt = _summary_pivot(frame)
 
         st.caption("Rows: **Submission Mode → (— Total — then dates)** · Columns: **Pharmacy Name** · Values: **Row count** or **sum of selected field**. Grand Total at bottom.")
         st.dataframe(pvt, use_container_width=True, hide_index=True)
 
-        # 10) Excel download
-        out = io.BytesIO()
-        with pd.ExcelWriter(out, engine="xlsxwriter") as xw:
-            pvt.to_excel(xw, sheet_name="Summary", index=False)
-        st.download_button("⬇️ Download Summary (Excel)", data=out.getvalue(),
-                           file_name=f"{mod}_Summary_{datetime.now():%Y%m%d_%H%M%S}.xlsx",
-                           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        # 10) Excel download: serialized only when asked for (memoized per pivot after that)
+        if st.checkbox("Prepare Excel download", value=False, key="sum_xlsx"):
+            st.download_button("⬇️ Download Summary (Excel)", data=_summary_xlsx(pvt),
+                               file_name=f"{mod}_Summary_{datetime.now():%Y%m%d_%H%M%S}.xlsx",
+                               mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
         if st.button("🔄 Refresh summary", key="sum_refresh"):
-            load_module_df.clear(); st.rerun()
+            bump_module_version(sheet); st.rerun()
 
 @st.cache_data(ttl=120, show_spinner=False)
 def _clinic_opening_map() -> dict:
@@ -3092,13 +3612,13 @@ def _clinic_opening_map() -> dict:
         df = read_sheet_df(CLINIC_PURCHASE_OPENING, ["Item","OpeningQty","OpeningValue"]).fillna("")
         if df.empty: return {}
         df["OpeningQty"] = pd.to_numeric(df["OpeningQty"], errors="coerce").fillna(0.0)
-        return {str(r["Item"]).strip(): float(r["OpeningQty"]) for _, r in df.iterrows() if str(r.get("Item","")).strip()}
+        return {i: float(q) for i, q in zip(df["Item"].astype(str).str.strip(), df["OpeningQty"]) if i}
     except Exception:
         return {}
 
 def _render_clinic_purchase_summary(sheet_name: str):
     import numpy as np
-    df = _apply_common_filters(load_module_df(sheet_name), scope_to_user=False)
+    df = _apply_common_filters(load_module_df(sheet_name), scope_to_user=False, sheet_name=sheet_name)
     if df.empty:
         st.info("No Clinic Purchase data yet."); return
 
@@ -3127,33 +3647,26 @@ def _render_clinic_purchase_summary(sheet_name: str):
         dmax = df["Date"].max() if df["Date"].notna().any() else date.today()
         f_date = st.date_input("Date range", value=(dmin, dmax))
         f_items = st.multiselect("Item(s)", sorted([x for x in df["Item"].unique() if x]))
+    # One combined mask, one slice
+    mask = np.ones(len(df), dtype=bool)
     if f_date and all(f_date):
-        df = df[(df["Date"]>=f_date[0]) & (df["Date"]<=f_date[1])]
+        mask &= ((df["Date"]>=f_date[0]) & (df["Date"]<=f_date[1])).to_numpy()
     if f_items:
-        df = df[df["Item"].isin(f_items)]
+        mask &= df["Item"].isin(f_items).to_numpy()
+    df = df[mask]
 
     if df.empty:
         st.warning("No rows after filters."); return
 
-    # Running Instock by item/date
+    # Running Instock by item/date: opening + per-item cumulative (SP - Util), column-wise
     opening = _clinic_opening_map()
-    rows = []
-    for item, grp in df.groupby("Item"):
-        grp = grp.sort_values("Date")
-        prev = float(opening.get(item, 0.0))
-        unit = float(pm.get(item, 0.0))
-        for _, r in grp.iterrows():
-            instock_qty = prev + float(r["SP_Qty"]) - float(r["Util_Qty"])
-            rows.append({
-                "Date": r["Date"], "Item": item,
-                "Clinic_Qty": r["Clinic_Qty"], "Clinic_Value": r["Clinic_Value"],
-                "SP_Qty": r["SP_Qty"], "SP_Value": r["SP_Value"],
-                "Util_Qty": r["Util_Qty"], "Util_Value": r["Util_Value"],
-                "Instock_Qty": instock_qty,
-                "Instock_Value": round(instock_qty * unit, 2),
-            })
-            prev = instock_qty
-    out = pd.DataFrame(rows)
+    df = df.sort_values(["Item", "Date"], kind="stable", ignore_index=True)
+    instock = (df["Item"].map(opening).fillna(0.0).astype(float)
+               + (df["SP_Qty"] - df["Util_Qty"]).groupby(df["Item"], sort=False).cumsum())
+    out = df[["Date","Item","Clinic_Qty","Clinic_Value","SP_Qty","SP_Value","Util_Qty","Util_Value"]].assign(
+        Instock_Qty=instock,
+        Instock_Value=(instock * df["UnitPrice"]).round(2),
+    )
 
     # Per-day total rows
     num_cols = ["Clinic_Qty","Clinic_Value","SP_Qty","SP_Value","Util_Qty","Util_Value","Instock_Qty","Instock_Value"]
@@ -3181,14 +3694,14 @@ def _render_update_record_page():
 
         # Load and apply ACLs (client/pharmacy + per-user)
         df = load_module_df(sheet)
-        df = _apply_common_filters(df, scope_to_user=True)
+        df = _apply_common_filters(df, scope_to_user=True, sheet_name=sheet)
 
         if df.empty:
             st.info("No rows to edit for your scope."); return
 
         # ------- Flexible filters (ClaimID, EID, Patient, Approval, Member, Insurance, Status)
+        lowmap = {c.strip().lower(): c for c in df.columns}  # built once per page run, not per lookup
         def _find_col(cands: list[str]) -> str | None:
-            lowmap = {c.strip().lower(): c for c in df.columns}
             for c in cands:
                 k = c.strip().lower()
                 if k in lowmap:
@@ -3218,20 +3731,20 @@ def _render_update_record_page():
                 else:
                     f_insurance = ""
                 if col_status:
-                    opts = [""] + sorted([x for x in df[col_status].astype(str).unique() if x])
+                    opts = [""] + column_options(df, sheet, col_status, scope_to_user=True)
                     f_status = st.selectbox("Status", opts, index=0, key="f_status")
                 else:
                     f_status = ""
 
         # ---------- Apply filters (safe even when EVERYTHING is blank) ----------
-        # Start with a True vector aligned to the dataframe index
-        mask = pd.Series(True, index=df.index)
+        # Start with a True vector (one bool per row)
+        mask = np.ones(len(df), dtype=bool)
 
         def _and_contains(col: str | None, needle: str):
             nonlocal mask
             if col and needle and needle.strip():
                 # case-insensitive contains; escape to avoid regex surprises
-                mask &= df[col].astype(str).str.contains(re.escape(needle.strip()), case=False, na=False)
+                mask &= _as_text(df[col]).str.contains(re.escape(needle.strip()), case=False, na=False).to_numpy()
 
         _and_contains(col_claim,   f_claim)
         _and_contains(col_eid,     f_eid)
@@ -3241,7 +3754,7 @@ def _render_update_record_page():
         _and_contains(col_ins,     f_insurance)
 
         if col_status and f_status:
-            mask &= (df[col_status].astype(str) == f_status)
+            mask &= (_as_text(df[col_status]) == f_status).to_numpy()
 
         df = df[mask]
         # -----------------------------------------------------------------------
@@ -3263,16 +3776,14 @@ def _render_update_record_page():
         # 3-column grid like other modules
         cols = st.columns(3, gap="large")
         
+        # Explicit config from Modules.NumericFieldsJSON (pre-parsed at catalog load), matched case-insensitively
+        cat = modules_catalog_df()
+        cat_row = cat[cat["Module"] == mod] if not cat.empty else cat
+        num_cfg = {str(x).lower() for x in cat_row.iloc[0]["_NumericFields"]} if not cat_row.empty else set()
+
         def _is_numbery(col_name: str) -> bool:
-            # Prefer explicit config from Modules.NumericFieldsJSON (case-insensitive match)
-            try:
-                cat = modules_catalog_df()
-                row = cat[cat["Module"] == mod]
-                nums = json.loads(row.iloc[0]["NumericFieldsJSON"]) if not row.empty else []
-                if str(col_name).lower() in {str(x).lower() for x in nums}:
-                    return True
-            except Exception:
-                pass
+            if str(col_name).lower() in num_cfg:
+                return True
             # Fallback: data-driven check
             if col_name not in df.columns:
                 return False
@@ -3331,7 +3842,7 @@ def _render_update_record_page():
 
             w.update(f"A{sheet_row_num}", [[cur_map.get(h, "") for h in header]])
             st.success("Row updated.")
-            load_module_df.clear()
+            bump_module_version(sheet)
             st.rerun()
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -3350,27 +3861,16 @@ def nav_pages_for(role: str):
                   else ["Summary"])
 
     # add any Tools granted in UserModules (treat tool names as modules)
-    um = user_modules_df()
-    extra = []
-    if not um.empty:
-        mine = um[(um["Username"].str.lower() == str(username).lower()) & (um["Enabled"])]
-        extra = [m for m in mine["Module"].astype(str).tolist() if m in STATIC_PAGES]
+    extra = [m for m in user_module_index().get(str(username).lower(), ()) if m in STATIC_PAGES]
 
     pages = sorted(set(base_pages) | set(extra))
     return module_pairs, pages
 
 # One-time ensure Clinic Purchase module + sheets exist/enabled for this client
 # Only seed Sheets assets when not using Postgres/Neon
-if not USE_POSTGRES:
-    seed_clinic_purchase_assets_for_client(CLIENT_ID)
-
-_clear_all_caches()  # make sure newly seeded rows are visible to this session
-
-# One-time ensure Clinic Purchase module + sheets exist/enabled for this client
-# Only seed Sheets when not using Postgres/Neon
-if not USE_POSTGRES:
-    seed_clinic_purchase_assets_for_client(CLIENT_ID)
-_clear_all_caches()
+if not USE_POSTGRES and seed_clinic_purchase_assets_for_client(CLIENT_ID):
+    _clear_all_caches()  # make sure newly seeded rows are visible to this session
+_prime_master_caches()
 
 module_pairs, static_pages = nav_pages_for(ROLE)
 
@@ -3499,7 +3999,7 @@ def _render_summary_page():
         sheet = dict(module_pairs)[mod]
 
         # Load & scope
-        df = _apply_common_filters(load_module_df(sheet), scope_to_user=False)
+        df = _apply_common_filters(load_module_df(sheet), scope_to_user=False, sheet_name=sheet)
         if df.empty:
             st.info("No data for the selected scope."); return
 
@@ -3519,7 +4019,7 @@ def _render_summary_page():
                 base = pd.pivot_table(df, index=["_Mode","_Date"], columns="_Pharm", aggfunc="size", fill_value=0)
             else:
                 vals = pd.to_numeric(df[values_col], errors="coerce").fillna(0.0)
-                tmp = df.copy(); tmp["_val"] = vals
+                tmp = df[["_Mode","_Date","_Pharm"]].assign(_val=vals)
                 base = pd.pivot_table(tmp, index=["_Mode","_Date"], columns="_Pharm", values="_val", aggfunc="sum", fill_value=0.0)
             base = base.sort_index(level=[0,1])
             # alpha order columns
@@ -3547,18 +4047,16 @@ def _render_summary_page():
         st.dataframe(pvt, use_container_width=True, hide_index=True)
 
         # Excel download — keep nav state; do not rerun into another page
-        out = io.BytesIO()
-        with pd.ExcelWriter(out, engine="xlsxwriter") as xw:
-            pvt.to_excel(xw, sheet_name="Summary", index=False)
+        out = _xlsx_bytes(pvt, "Summary")
         st.download_button(
             "⬇️ Download Summary (Excel)",
-            data=out.getvalue(),
+            data=out,
             file_name=f"{mod}_Summary_{datetime.now():%Y%m%d_%H%M%S}.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             key="sum_dl_v2"
         )
 
-        st.button("🔄 Refresh summary", key="sum_refresh_v2", on_click=lambda: load_module_df.clear())
+        st.button("🔄 Refresh summary", key="sum_refresh_v2", on_click=lambda: bump_module_version(sheet))
 
 
 # --- Override: Update Record with click-to-select row and safe editing ---
@@ -3571,7 +4069,7 @@ def _render_update_record_page():
         sheet = dict(module_pairs)[mod]
 
         df = load_module_df(sheet)
-        df = _apply_common_filters(df, scope_to_user=True)
+        df = _apply_common_filters(df, scope_to_user=True, sheet_name=sheet)
         if df.empty:
             st.info("No rows to edit for your scope."); return
 
@@ -3653,7 +4151,7 @@ def _render_update_record_page():
                             headers = list(new_df.columns)
                             import gspread
                             ws(sheet).update("A1", [headers] + new_df.fillna("").astype(str).values.tolist())
-                        load_module_df.clear()
+                        bump_module_version(sheet)
                         st.success("Row updated.")
                     except Exception as e:
                         st.error(f"Failed to save: {e}")
@@ -3679,8 +4177,7 @@ def _rt_inv_items_price_map():
         client = _gclient() if "_gclient" in globals() else _gspread.authorize(_Creds.from_service_account_info(GS))
         sid = GS.get("spreadsheet_id") or GS.get("spreadsheets_id") or ""
         if not sid and GS.get("sheet_url"):
-            import re as _re
-            m = _re.search(r"/spreadsheets/d/([A-Za-z0-9-_]+)", GS["sheet_url"])
+            m = _SHEET_ID_RE.search(GS["sheet_url"])
             if m: sid = m.group(1)
         sh = client.open_by_key(sid)
         ws = sh.worksheet("MS:Items")
@@ -3733,7 +4230,7 @@ def _rt_compute_inventory(pharmacy_id=None):
         "Total Available (Qty)": float(grp["Available_Qty"].sum()),
         "Total Available (Value)": float(grp["Available_Value"].sum()),
     }
-    disp = grp[["Item","Price","OpeningQty","Clinic_Qty","SP_Qty","Util_Qty","Available_Qty","Available_Value"]].copy().sort_values(by=["Item"]).reset_index(drop=True)
+    disp = grp[["Item","Price","OpeningQty","Clinic_Qty","SP_Qty","Util_Qty","Available_Qty","Available_Value"]].sort_values(by=["Item"]).reset_index(drop=True)
     return disp, summary
 
 def _rt_render_inventory_page():